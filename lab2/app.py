@@ -1,10 +1,23 @@
+import io
 import os
-from flask import Flask, request, render_template, redirect, url_for
+import mimetypes
+from datetime import datetime, timezone
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, render_template, redirect, url_for, abort, jsonify, Response, stream_with_context, g
 from werkzeug.utils import secure_filename
-import cv2
 import numpy as np
 import traceback
 
+from batch import detach_uploads, iter_sources, process_batch, stream_ndjson, stream_zip
+from cache import ResultCache
+from jobs import JobQueue, QueueFull
+from metrics import SIZE_BUCKETS, Counter, Gauge, Histogram, Registry, resident_memory_bytes
+from pipeline import STAGES, Timings, decode_image, encode_image, process_bytes, run_detections, run_pipeline
+from preview import PREVIEW_SIDE, PreviewStore, pick_level, rescale_detections
+from stream import MJPEG_MIMETYPE, StreamProcessor, iter_mjpeg_frames, open_video
+
 
 app = Flask(__name__)
 app.debug = True
@@ -12,12 +25,102 @@ app.debug = True
 app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static/uploads')
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Uploads and results live in the result store, False keeps it in memory only
+app.config['PERSIST_UPLOADS'] = True
+app.config['CACHE_MEMORY_ITEMS'] = 32
+app.config['CACHE_DISK_BYTES'] = 512 * 1024 * 1024
+app.config['RESULT_TTL'] = 24 * 60 * 60
+app.config['RESULT_GC_INTERVAL'] = 5 * 60
+result_cache = ResultCache(os.path.join(app.config['UPLOAD_FOLDER'], 'cache') if app.config['PERSIST_UPLOADS'] else None,
+                           memory_items=app.config['CACHE_MEMORY_ITEMS'],
+                           disk_bytes=app.config['CACHE_DISK_BYTES'],
+                           ttl=app.config['RESULT_TTL'],
+                           gc_interval=app.config['RESULT_GC_INTERVAL'])
+
+# None keeps the format of the upload, '.png', '.jpg' or '.webp' re-encodes every result
+app.config['RESULT_FORMAT'] = None
+# JPEG and WebP quality 0-100, PNG compression level 0-9
+app.config['RESULT_QUALITY'] = {'.jpg': 85, '.jpeg': 85, '.png': 6, '.webp': 80}
+mimetypes.add_type('image/webp', '.webp')
+
+# True adds a Server-Timing header to every response, ?timing=1 adds it to one request
+app.config['SERVER_TIMING'] = False
+metrics = Registry()
+requests_total = metrics.register(Counter('lab2_requests_total', 'Handled requests.', ['endpoint', 'status']))
+request_seconds = metrics.register(Histogram('lab2_request_seconds', 'Request latency in seconds.', ['endpoint']))
+request_bytes = metrics.register(Histogram('lab2_request_bytes', 'Request body size in bytes.', ['endpoint'],
+                                           buckets=SIZE_BUCKETS))
+step_seconds = metrics.register(Histogram('lab2_step_seconds', 'Duration of one pipeline step in seconds.', ['step']))
+request_peak_bytes = metrics.register(Histogram('lab2_request_peak_bytes',
+                                                'Peak size of the image arrays held by one request.',
+                                                buckets=SIZE_BUCKETS))
+metrics.register(Gauge('process_resident_memory_bytes', 'Resident memory size in bytes.', resident_memory_bytes))
+for stat in ('hits', 'misses', 'evictions', 'memory_evictions', 'expirations'):
+    metrics.register(Gauge(f'lab2_cache_{stat}_total', f"Result cache {stat.replace('_', ' ')}.",
+                           lambda stat=stat: result_cache.stats()[stat], kind='counter'))
+
+def observe_timings(steps, peak_bytes):
+    for step, seconds in steps.items():
+        step_seconds.observe(seconds, step=step)
+    if peak_bytes:
+        request_peak_bytes.observe(peak_bytes)
+
+app.config['PREVIEW_UPLOADS'] = 8
+app.config['PREVIEW_BYTES'] = 256 * 1024 * 1024
+preview_store = PreviewStore(max_uploads=app.config['PREVIEW_UPLOADS'], max_bytes=app.config['PREVIEW_BYTES'])
+
+app.config['JOB_WORKERS'] = os.cpu_count()
+app.config['JOB_MAX_PENDING'] = 16
+job_queue = JobQueue(result_cache, max_workers=app.config['JOB_WORKERS'],
+                     max_pending=app.config['JOB_MAX_PENDING'], on_timings=observe_timings)
+
+# OpenCV releases the GIL, so batch images are processed on threads
+app.config['BATCH_WORKERS'] = os.cpu_count()
+app.config['BATCH_WINDOW'] = 2 * app.config['BATCH_WORKERS']
+batch_executor = ThreadPoolExecutor(max_workers=app.config['BATCH_WORKERS'])
+
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp'}
 
 def allowed_file(filename):
     return '.' in filename and \
 filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'mjpeg', 'mjpg'}
+
+def allowed_video(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in VIDEO_EXTENSIONS
+
+@app.before_request
+def start_timing():
+    g.started = time.perf_counter()
+    g.timings = Timings()
+
+@app.after_request
+def record_timing(response):
+    endpoint = request.endpoint or 'unknown'
+    started = g.started
+    elapsed = time.perf_counter() - started
+    requests_total.inc(endpoint=endpoint, status=response.status_code)
+    if response.is_streamed:
+        # The body of /batch and /stream is generated after this hook, the latency ends when it is closed
+        response.call_on_close(lambda: request_seconds.observe(time.perf_counter() - started, endpoint=endpoint))
+    else:
+        request_seconds.observe(elapsed, endpoint=endpoint)
+    if request.content_length:
+        request_bytes.observe(request.content_length, endpoint=endpoint)
+    observe_timings(g.timings.steps, g.timings.peak_bytes)
+    if app.config['SERVER_TIMING'] or request.args.get('timing') == '1':
+        steps = g.timings.server_timing()
+        # Headers go out before a streamed body is generated, so only the time to set it up is known
+        label = 'setup' if response.is_streamed else 'total'
+        total = f'{label};dur={elapsed * 1000:.2f}'
+        response.headers['Server-Timing'] = f'{steps}, {total}' if steps else total
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/', methods=['GET', 'POST'])
 def upload_image():
     if request.method == 'POST':
@@ -28,122 +131,328 @@ def upload_image():
             return "No file selected for uploading.", 400
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            data = file.read()
+            methods = normalize_methods(request.form.getlist('methods'))
+            ext = result_extension(filename)
 
-            methods = request.form.getlist('methods')
+            # The original goes to the result store too, so its lifetime is managed the same way
+            original_name = result_cache.key(data, [], {'original': True}) + ext
+            if result_cache.get(original_name) is None:
+                result_cache.put(original_name, data)
 
             try:
-                processed_image_path = process_image(filepath, methods)
+                result_name, _ = cached_process(data, methods, *output_format(ext, *requested_output()), g.timings)
             except Exception as e:
                 app.logger.error(f"Error processing image: {e}\n{traceback.format_exc()}")
                 return f"An error occurred while processing the image: {e}", 500
 
-            return render_template('result.html', original_image=filepath, processed_image=processed_image_path)
+            return render_template('result.html',
+                                   original_image=url_for('cached_result', name=original_name),
+                                   processed_image=url_for('cached_result', name=result_name))
         else:
             return "Invalid file type. Only PNG, JPG, JPEG, and BMP files are allowed.", 400
     return render_template('upload.html')
 
-def process_image(filepath, methods):
-    img = cv2.imread(filepath)
-    if img is None:
-       raise ValueError(f"Could not load image at {filepath}. Ensure the file is an image and in a supported format.")
-    result_img = img.copy()
-   
-    for method in methods:
-        if method == 'corners':
-            result_img = detect_corners(result_img)
-        elif method == 'lines':
-            result_img = detect_lines(result_img)
-        elif method == 'edges':
-            result_img = detect_edges(result_img)
-        elif method == 'morphology':
-            result_img = morphology_transform(result_img)
-        elif method == 'brightness':
-            result_img = detect_brightness_changes(result_img)
-        elif method == 'points':
-            result_img = detect_points(result_img)
-   
-    filename = os.path.basename(filepath)
-    filename_without_ext, ext = os.path.splitext(filename)
-    if not ext:
-        ext = '.png'
-   
-    processed_filename = f'processed_{filename_without_ext}{ext}'
-    processed_image_path = os.path.join(app.config['UPLOAD_FOLDER'], processed_filename)
-   
-    if not cv2.imwrite(processed_image_path, result_img):
-        raise ValueError(f"Could not write image to {processed_image_path}. Check the path and file permissions.")
-   
-    return processed_image_path
-
-def detect_brightness_changes(img):
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-    grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-    grad_mag = cv2.magnitude(grad_x, grad_y)
-    grad_mag = cv2.convertScaleAbs(grad_mag)
-
-    _, thresh = cv2.threshold(grad_mag, 50, 255, cv2.THRESH_BINARY)
-
-
-    result_img = cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
-    return result_img
-
-
-def detect_corners(img):
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    gray = np.float32(gray)
-    dst = cv2.cornerHarris(gray, blockSize=2, ksize=3, k=0.04)
-    dst = cv2.dilate(dst, None)
-    img[dst > 0.01 * dst.max()] = [0, 0, 255]
-    return img
-
-def detect_lines(img):
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-    lines = cv2.HoughLines(edges, 1, np.pi / 180, 100)
-    if lines is not None:
-        for rho_theta in lines:
-            rho, theta = rho_theta[0]
-            a = np.cos(theta)
-            b = np.sin(theta)
-            x0 = a * rho
-            y0 = b * rho
-            x1 = int(x0 + 1000 * (-b))
-            y1 = int(y0 + 1000 * (a))
-            x2 = int(x0 - 1000 * (-b))
-
-            y2 = int(y0 - 1000 * (a))
-            cv2.line(img, (x1, y1), (x2, y2), (0, 0, 255), 2)
-    return img
-
-def detect_edges(img):
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    edges = cv2.Canny(gray, 100, 200)
-    edges_bgr = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
-    return edges_bgr
-
-def detect_points(img):
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    params = cv2.SimpleBlobDetector_Params()
-    params.filterByArea = True
-    params.minArea = 100
-    params.filterByCircularity = False
-    params.filterByConvexity = False
-    params.filterByInertia = False
-    detector = cv2.SimpleBlobDetector_create(params)
-    keypoints = detector.detect(gray)
-    img_final = cv2.drawKeypoints(img, keypoints, np.array([]), (0,0,255), cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS)
-    return img_final
-
-def morphology_transform(img):
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    _, thresh = cv2.threshold(gray, 180, 255, cv2.THRESH_BINARY)
-    kernel = np.ones((5, 5), np.uint8)
-    closing = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-    closing_bgr = cv2.cvtColor(closing, cv2.COLOR_GRAY2BGR)
-    return closing_bgr
+@app.route('/process', methods=['POST'])
+def process_upload():
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return "No file part in the request.", 400
+    if not allowed_file(file.filename):
+        return "Invalid file type. Only PNG, JPG, JPEG, and BMP files are allowed.", 400
+
+    methods = normalize_methods(request.form.getlist('methods'))
+    ext, quality = output_format(result_extension(secure_filename(file.filename)), *requested_output())
+    try:
+        _, encoded = cached_process(file.read(), methods, ext, quality, g.timings)
+    except Exception as e:
+        app.logger.error(f"Error processing image: {e}\n{traceback.format_exc()}")
+        return f"An error occurred while processing the image: {e}", 500
+
+    return Response(encoded, mimetype=mimetypes.guess_type('result' + ext)[0])
+
+@app.route('/batch', methods=['POST'])
+def batch_upload():
+    files = request.files.getlist('files') + request.files.getlist('file')
+    if not any(file.filename for file in files):
+        return "No file part in the request.", 400
+    output = request.form.get('format', 'zip')
+    if output not in ('zip', 'ndjson'):
+        return "Invalid format. Use zip or ndjson.", 400
+    methods = normalize_methods(request.form.getlist('methods'))
+    uploads = detach_uploads(files)
+    requested = requested_output()
+
+    def process(name, data):
+        timings = Timings()
+        result = cached_process(data, methods, *output_format(result_extension(name), *requested), timings)
+        observe_timings(timings.steps, timings.peak_bytes)
+        return result
+
+    def results():
+        sources = iter_sources(uploads, allowed_file)
+        for name, result, error in process_batch(sources, process, batch_executor, app.config['BATCH_WINDOW']):
+            if error is not None:
+                yield name, None, {'file': name, 'status': 'failed', 'error': str(error)}
+            else:
+                result_name, encoded = result
+                entry = {'file': name, 'status': 'done', 'result_url': url_for('cached_result', name=result_name)}
+                yield f'processed_{name}', encoded, entry
+
+    if output == 'ndjson':
+        body = stream_ndjson(entry for _, _, entry in results())
+        return Response(stream_with_context(body), mimetype='application/x-ndjson')
+    return Response(stream_with_context(stream_zip(results())), mimetype='application/zip',
+                    headers={'Content-Disposition': 'attachment; filename=processed.zip'})
+
+@app.route('/stream', methods=['POST'])
+def stream_video():
+    methods = normalize_methods(request.values.getlist('methods'))
+    realtime = request.values.get('realtime', '1') != '0'
+    processor = StreamProcessor(methods, realtime=realtime)
+
+    if request.mimetype in ('multipart/x-mixed-replace', 'video/x-motion-jpeg'):
+        # A live MJPEG upload, frames are decoded while the body arrives
+        frames, fps = iter_mjpeg_frames(request.stream), 0
+        cleanup = None
+    else:
+        file = request.files.get('file')
+        if file is None or file.filename == '':
+            return "No file part in the request.", 400
+        if not allowed_video(file.filename):
+            return "Invalid file type. Only MP4, AVI, MOV, MKV and MJPEG videos are allowed.", 400
+        # VideoCapture reads from a path, so the upload goes to a temporary file
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(secure_filename(file.filename))[1],
+                                         delete=False) as tmp:
+            file.save(tmp)
+        cleanup = tmp.name
+        try:
+            fps, frames = open_video(tmp.name)
+        except ValueError as e:
+            os.remove(tmp.name)
+            return str(e), 400
+        if not realtime:
+            fps = 0
+
+    def parts():
+        try:
+            yield from processor.run(frames, fps)
+        finally:
+            app.logger.info(f"Stream finished: {processor.stats()}")
+            if cleanup is not None:
+                os.remove(cleanup)
+
+    return Response(stream_with_context(parts()), mimetype=MJPEG_MIMETYPE)
+
+@app.route('/detect', methods=['POST'])
+def detect_upload():
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return "No file part in the request.", 400
+    if not allowed_file(file.filename):
+        return "Invalid file type. Only PNG, JPG, JPEG, and BMP files are allowed.", 400
+    output = request.form.get('format', 'json')
+    if output not in ('json', 'npz'):
+        return "Invalid format. Use json or npz.", 400
+
+    methods = normalize_methods(request.form.getlist('methods'))
+    try:
+        with g.timings.measure('decode'):
+            img = decode_image(file.read())
+        results = run_detections(img, methods, g.timings)
+    except Exception as e:
+        app.logger.error(f"Error processing image: {e}\n{traceback.format_exc()}")
+        return f"An error occurred while processing the image: {e}", 500
+
+    height, width = img.shape[:2]
+    if output == 'npz':
+        arrays = {f'{method}.{name}': value for method, values in results.items() for name, value in values.items()}
+        buffer = io.BytesIO()
+        np.savez(buffer, shape=np.array([height, width]), **arrays)
+        return Response(buffer.getvalue(), mimetype='application/octet-stream',
+                        headers={'Content-Disposition': 'attachment; filename=detections.npz'})
+    return jsonify({'width': width, 'height': height, 'detections': detections_to_json(results)})
+
+def detections_to_json(results):
+    # Masks are only sent in the npz format, JSON gets their pixel counts
+    return {
+        method: {name: np.round(value, 3).tolist() if value.dtype.kind == 'f' else value.tolist()
+                 for name, value in values.items() if name != 'mask'}
+        for method, values in results.items()
+    }
+
+@app.route('/preview', methods=['POST'])
+def preview_upload():
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return "No file part in the request.", 400
+    if not allowed_file(file.filename):
+        return "Invalid file type. Only PNG, JPG, JPEG, and BMP files are allowed.", 400
+
+    data = file.read()
+    try:
+        with g.timings.measure('decode'):
+            img = decode_image(data)
+        with g.timings.measure('pyramid'):
+            upload_id = preview_store.add(data, result_extension(secure_filename(file.filename)), img)
+    except Exception as e:
+        app.logger.error(f"Error processing image: {e}\n{traceback.format_exc()}")
+        return f"An error occurred while processing the image: {e}", 500
+
+    methods = normalize_methods(request.form.getlist('methods'))
+    shapes = preview_store.get(upload_id)['shapes']
+    return jsonify({
+        'upload': upload_id,
+        'levels': [[shape[1], shape[0]] for shape in shapes],
+        'preview_url': url_for('preview_image', upload_id=upload_id, methods=methods),
+        'detections_url': url_for('preview_detections', upload_id=upload_id, methods=methods),
+        'full_url': url_for('preview_full', upload_id=upload_id, methods=methods),
+    })
+
+def preview_record():
+    record = preview_store.get(request.view_args['upload_id'])
+    if record is None:
+        abort(404)
+    methods = normalize_methods(request.args.getlist('methods'))
+    level = pick_level(record['shapes'], request.args.get('side', PREVIEW_SIDE, type=int))
+    return record, methods, level
+
+@app.route('/preview/<upload_id>')
+def preview_image(upload_id):
+    record, methods, level = preview_record()
+    key = (tuple(methods), level)
+    encoded = preview_store.get_preview(record, key)
+    if encoded is None:
+        result = run_pipeline(preview_store.level(record, level), methods, timings=g.timings)
+        with g.timings.measure('encode'):
+            encoded = encode_image(result, '.jpg')
+        preview_store.put_preview(record, key, encoded)
+    return Response(encoded, mimetype='image/jpeg', headers={'X-Preview-Scale': str(2 ** level)})
+
+@app.route('/preview/<upload_id>/detections')
+def preview_detections(upload_id):
+    record, methods, level = preview_record()
+    img = preview_store.level(record, level)
+    results = rescale_detections(run_detections(img, methods, g.timings), 2 ** level)
+    height, width = record['shapes'][0][:2]
+    return jsonify({'width': width, 'height': height, 'scale': 2 ** level,
+                    'detections': detections_to_json(results)})
+
+@app.route('/preview/<upload_id>/full')
+def preview_full(upload_id):
+    record = preview_store.get(upload_id)
+    if record is None:
+        abort(404)
+    methods = normalize_methods(request.args.getlist('methods'))
+    ext, quality = output_format(record['ext'], *requested_output())
+    # Same cache entry and the same path as a regular upload of these bytes, tiled for large scans
+    name = result_name_for(record['data'], methods, ext, quality)
+    if result_cache.get(name) is None:
+        result_cache.put(name, process_bytes(record['data'], methods, ext, timings=g.timings, quality=quality))
+    return redirect(url_for('cached_result', name=name))
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return "No file part in the request.", 400
+    if not allowed_file(file.filename):
+        return "Invalid file type. Only PNG, JPG, JPEG, and BMP files are allowed.", 400
+
+    data = file.read()
+    methods = normalize_methods(request.form.getlist('methods'))
+    ext, quality = output_format(result_extension(secure_filename(file.filename)), *requested_output())
+    result_name = result_name_for(data, methods, ext, quality)
+    try:
+        job_id = job_queue.submit(data, methods, ext, result_name, quality)
+    except QueueFull as e:
+        return f"The job queue is full, try again later. {e}", 503, {'Retry-After': '5'}
+
+    return jsonify(job_status_payload(job_queue.status(job_id))), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.status(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job_status_payload(job))
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_queue.status(job_id)
+    if job is None:
+        abort(404)
+    if job['status'] != 'done':
+        return jsonify(job_status_payload(job)), 409
+    return redirect(url_for('cached_result', name=job['result']))
+
+def job_status_payload(job):
+    payload = dict(job, status_url=url_for('job_status', job_id=job['id']))
+    if job['result'] is not None:
+        payload['result_url'] = url_for('cached_result', name=job['result'])
+    return payload
+
+@app.route('/results/<name>')
+def cached_result(name):
+    name = secure_filename(name)
+    entry = result_cache.get_entry(name)
+    if entry is None:
+        abort(404)
+    data, stored = entry
+    response = Response(data, mimetype=mimetypes.guess_type(name)[0])
+    # Names are content hashes, so the name is a strong ETag; browsers revalidate instead of downloading
+    response.set_etag(os.path.splitext(name)[0])
+    response.last_modified = datetime.fromtimestamp(int(stored), timezone.utc)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+def normalize_methods(methods):
+    return [method for method in methods if method in STAGES]
+
+def result_extension(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if ext else '.png'
+
+def requested_output():
+    """
+    Read the optional image_format and quality fields of the request.
+    :return: Tuple (format or None, quality or None) for output_format
+    """
+    image_format = request.values.get('image_format', '').lower().lstrip('.')
+    if image_format not in ('png', 'jpg', 'jpeg', 'webp'):
+        image_format = None
+    return image_format, request.values.get('quality', type=int)
+
+def output_format(ext, image_format=None, quality=None):
+    """
+    Pick the output format and quality of a result.
+    :param ext: Extension of the upload
+    :param image_format: Requested format, overrides RESULT_FORMAT
+    :param quality: Requested quality, overrides RESULT_QUALITY
+    :return: Tuple (extension, quality)
+    """
+    if image_format is not None:
+        ext = '.' + image_format
+    elif app.config['RESULT_FORMAT'] is not None:
+        ext = app.config['RESULT_FORMAT']
+    if quality is None:
+        quality = app.config['RESULT_QUALITY'].get(ext)
+    return ext, quality
+
+def result_name_for(data, methods, ext, quality):
+    return result_cache.key(data, methods, {'ext': ext, 'quality': quality}) + ext
+
+def cached_process(data, methods, ext, quality=None, timings=None):
+    name = result_name_for(data, methods, ext, quality)
+    encoded = result_cache.get(name)
+    if encoded is None:
+        encoded = process_bytes(data, methods, ext, timings=timings, quality=quality)
+        result_cache.put(name, encoded)
+    return name, encoded
 
 if __name__ == '__main__':
     app.run(debug=True)
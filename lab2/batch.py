@@ -0,0 +1,136 @@
+import io
+import json
+import os
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from werkzeug.utils import secure_filename
+
+
+def detach_uploads(files):
+    """
+    Take the streams over from uploaded files.
+    Flask closes request files once the view returns, before a streamed
+    response is generated, so the streams are replaced with empty ones.
+    :param files: Uploaded werkzeug FileStorage objects
+    :return: List of (secure file name, stream)
+    """
+    uploads = []
+    for file in files:
+        uploads.append((secure_filename(file.filename), file.stream))
+        file.stream = io.BytesIO()
+    return uploads
+
+
+# Errors of a broken archive or member: bad headers, CRC mismatch, truncated or unsupported compression
+ARCHIVE_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, OSError, NotImplementedError)
+
+
+def iter_sources(uploads, allowed_file):
+    """
+    Yield (name, bytes, error) for every image of the batch, one at a time.
+    ZIP archives are opened in place and their members read lazily. An archive or
+    member that cannot be read yields (name, None, error) instead of stopping the batch.
+    :param uploads: List of (name, stream) from detach_uploads
+    :param allowed_file: Predicate accepting an image file name
+    """
+    for name, stream in uploads:
+        with stream:
+            if name.lower().endswith('.zip'):
+                try:
+                    archive = zipfile.ZipFile(stream)
+                except ARCHIVE_ERRORS as error:
+                    yield name, None, error
+                    continue
+                with archive:
+                    for info in archive.infolist():
+                        member = secure_filename(os.path.basename(info.filename))
+                        if info.is_dir() or not allowed_file(member):
+                            continue
+                        try:
+                            data = archive.read(info)
+                        except ARCHIVE_ERRORS as error:
+                            yield member, None, error
+                        else:
+                            yield member, data, None
+            elif allowed_file(name):
+                yield name, stream.read(), None
+
+
+def process_batch(sources, process, executor, window):
+    """
+    Run process(name, data) over the sources on an executor.
+    :param sources: Iterable of (name, bytes, error) from iter_sources
+    At most `window` images are in flight, so memory does not grow with the batch.
+    :return: Generator of (name, result, error) in completion order
+    """
+    pending = {}
+
+    def collect(done):
+        for future in done:
+            name = pending.pop(future)
+            error = future.exception()
+            yield name, None if error is not None else future.result(), error
+
+    for name, data, error in sources:
+        if error is not None:
+            # Unreadable sources are reported in order with the other results
+            yield name, None, error
+            continue
+        pending[executor.submit(process, name, data)] = name
+        if len(pending) >= window:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from collect(done)
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        yield from collect(done)
+
+
+class _StreamBuffer:
+    # Write-only file object, lets ZipFile produce an archive chunk by chunk
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_ndjson(entries):
+    for entry in entries:
+        yield json.dumps(entry) + '\n'
+
+
+def stream_zip(files):
+    """
+    Stream a ZIP archive while its members are produced.
+    :param files: Generator of (archive name, bytes or None, manifest entry);
+                  the manifest is written last as manifest.ndjson
+    """
+    buffer = _StreamBuffer()
+    entries = []
+    names = set()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for name, data, entry in files:
+            if data is not None:
+                stem, ext = os.path.splitext(name)
+                unique, n = name, 1
+                while unique in names:
+                    unique, n = f'{stem}_{n}{ext}', n + 1
+                names.add(unique)
+                archive.writestr(unique, data)
+                entry = dict(entry, archive_name=unique)
+            entries.append(entry)
+            yield buffer.drain()
+        archive.writestr('manifest.ndjson', ''.join(stream_ndjson(entries)))
+    yield buffer.drain()
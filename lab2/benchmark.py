@@ -0,0 +1,206 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from pipeline import Timings, run_pipeline, run_tiled
+
+
+METHODS = ['corners', 'lines', 'edges', 'morphology', 'brightness', 'points']
+COMBINATIONS = [
+    ['corners', 'lines'],
+    ['edges', 'lines'],
+    ['brightness', 'morphology'],
+    METHODS,
+]
+SIZES = [0.3, 1, 3, 12, 50]
+
+
+def synthetic_image(megapixels, seed=0):
+    """
+    Build a deterministic 4:3 test image with shapes, straight lines and noise,
+    so every detector has something to find.
+    :param megapixels: Image size in millions of pixels
+    :param seed: Random seed
+    :return: BGR image
+    """
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = int(round(megapixels * 1e6 / width))
+    rng = np.random.default_rng(seed)
+
+    gradient = np.linspace(40, 200, width, dtype=np.float32)
+    img = np.empty((height, width, 3), np.uint8)
+    img[:] = gradient[None, :, None].astype(np.uint8)
+
+    scale = max(width, height)
+    shapes = int(40 * megapixels) + 10
+    for _ in range(shapes):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        size = int(rng.integers(scale // 100 + 2, scale // 15 + 4))
+        kind = rng.integers(0, 3)
+        if kind == 0:
+            cv2.rectangle(img, (x, y), (x + size, y + size), color, -1)
+        elif kind == 1:
+            cv2.circle(img, (x, y), size // 2, color, -1)
+        else:
+            cv2.line(img, (x, y), (int(rng.integers(0, width)), int(rng.integers(0, height))), color, 3)
+
+    noise = rng.integers(0, 24, img.shape, dtype=np.uint8)
+    cv2.add(img, noise, dst=img)
+    return img
+
+
+def _run_case(methods, megapixels, repeat, warmup, tiled):
+    # Runs in a fresh process, so the peak RSS belongs to this case only
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    img = synthetic_image(megapixels)
+    run = run_tiled if tiled else run_pipeline
+
+    for _ in range(warmup):
+        run(img, methods)
+
+    latencies = []
+    steps = {}
+    peak_bytes = 0
+    for _ in range(repeat):
+        timings = Timings()
+        started = time.perf_counter()
+        run(img, methods, timings=timings)
+        latencies.append(time.perf_counter() - started)
+        for name, seconds in timings.steps.items():
+            steps[name] = steps.get(name, 0.0) + seconds / repeat
+        peak_bytes = max(peak_bytes, timings.peak_bytes)
+
+    latencies = np.array(latencies)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    actual_megapixels = img.shape[0] * img.shape[1] / 1e6
+    return {
+        'case': '+'.join(methods),
+        'methods': methods,
+        'megapixels': round(actual_megapixels, 3),
+        'width': img.shape[1],
+        'height': img.shape[0],
+        'tiled': tiled,
+        'repeat': repeat,
+        'latency_mean': float(latencies.mean()),
+        'latency_p50': float(np.percentile(latencies, 50)),
+        'latency_p99': float(np.percentile(latencies, 99)),
+        'throughput_mp_s': float(actual_megapixels / latencies.mean()),
+        'peak_rss_bytes': peak_rss,
+        'rss_over_baseline_bytes': peak_rss - baseline_rss,
+        'peak_array_bytes': peak_bytes,
+        'steps': {name: round(seconds, 6) for name, seconds in steps.items()},
+    }
+
+
+def run_benchmark(cases, sizes, repeat=5, warmup=1, tiled=False):
+    """
+    Run every case at every size, each in its own process.
+    :param cases: List of method lists
+    :param sizes: Image sizes in megapixels
+    :return: List of result dicts
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for megapixels in sizes:
+        for methods in cases:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(_run_case, methods, megapixels, repeat, warmup, tiled).result()
+            results.append(result)
+            print_result(result)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': multiprocessing.cpu_count(),
+    }
+
+
+def print_result(result):
+    print(f"{result['case']:<50} {result['megapixels']:>7.2f} MP "
+          f"p50 {result['latency_p50'] * 1000:>9.1f} ms  p99 {result['latency_p99'] * 1000:>9.1f} ms  "
+          f"{result['throughput_mp_s']:>7.1f} MP/s  RSS {result['peak_rss_bytes'] / 2 ** 20:>7.0f} MiB",
+          flush=True)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare p50 latencies with a saved baseline.
+    :param tolerance: Allowed relative slowdown, 0.1 is 10%
+    :return: List of regression descriptions
+    """
+    previous = {(r['case'], r['megapixels'], r['tiled']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get((result['case'], result['megapixels'], result['tiled']))
+        if old is None:
+            continue
+        ratio = result['latency_p50'] / old['latency_p50']
+        marker = ''
+        if ratio > 1 + tolerance:
+            marker = '  REGRESSION'
+            regressions.append(f"{result['case']} at {result['megapixels']} MP is {ratio:.2f}x slower")
+        print(f"{result['case']:<50} {result['megapixels']:>7.2f} MP  {ratio:>5.2f}x baseline{marker}")
+    return regressions
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments for the benchmark.
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the lab2 image-processing methods on synthetic images.")
+    parser.add_argument('-sizes', type=float, nargs='+', default=SIZES, help='Image sizes in megapixels')
+    parser.add_argument('-methods', nargs='+', default=None,
+                        help='Run only this method combination instead of every single method and the default combinations')
+    parser.add_argument('-repeat', type=int, default=5, help='Timed runs per case')
+    parser.add_argument('-warmup', type=int, default=1, help='Untimed runs per case')
+    parser.add_argument('-tiled', action='store_true', help='Use the tiled execution mode')
+    parser.add_argument('-save', help='Write the results as a JSON baseline to this path')
+    parser.add_argument('-compare', help='Compare with a JSON baseline written by -save')
+    parser.add_argument('-tolerance', type=float, default=0.1, help='Allowed relative slowdown against the baseline')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    cases = [args.methods] if args.methods else [[method] for method in METHODS] + COMBINATIONS
+
+    results = run_benchmark(cases, args.sizes, args.repeat, args.warmup, args.tiled)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('\n'.join(regressions))
+            sys.exit(1)
+
+#python3 benchmark.py -sizes 0.3 3 -save baseline.json
+
+if __name__ == '__main__':
+    main()
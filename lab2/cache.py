@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Content-addressed store of uploads and encoded results.
+    Entries live in an in-memory LRU tier and in a size-bounded directory on disk.
+    On disk the mtime of a file is the time it was stored and the atime the time
+    it was last used, so Last-Modified stays stable while hits refresh the LRU order.
+    :param directory: Directory of the disk tier, None keeps entries in memory only
+    :param memory_items: Maximum number of entries kept in memory
+    :param disk_bytes: Maximum total size of the disk tier in bytes
+    :param ttl: Seconds an unused entry is kept, None keeps entries until evicted
+    :param gc_interval: Seconds between background removals of expired entries
+    """
+
+    def __init__(self, directory, memory_items=32, disk_bytes=512 * 1024 * 1024, ttl=None, gc_interval=60):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Entries dropped from the memory tier only, with a disk tier they can still hit there
+        self.memory_evictions = 0
+        self.expirations = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._disk_size = sum(size for _, size, _ in self._disk_entries())
+        if ttl is not None:
+            threading.Thread(target=self._collect_periodically, args=(gc_interval,), daemon=True).start()
+
+    @staticmethod
+    def key(data, methods, params=None):
+        """
+        Build the cache key of a request.
+        :param data: Uploaded file bytes
+        :param methods: Selected methods, in order
+        :param params: Extra parameters that change the output
+        :return: Hex digest naming the entry
+        """
+        digest = hashlib.sha256(data)
+        digest.update(json.dumps([list(methods), params or {}], sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        """
+        Look an entry up, first in memory and then on disk.
+        :param name: Entry name, the key plus the file extension
+        :return: Entry bytes or None
+        """
+        entry = self.get_entry(name)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, name):
+        """
+        Like get, but also return when the entry was stored.
+        :return: Tuple (bytes, stored at as a Unix time) or None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(name)
+            if entry is not None and not self._expired(entry[2], now):
+                self._remember(name, entry[0], entry[1], now)
+                self.hits += 1
+                self.memory_hits += 1
+                self._touch(name, now)
+                return entry[0], entry[1]
+            if self.directory is None:
+                self.misses += 1
+                return None
+
+        path = self.path(name)
+        try:
+            stat = os.stat(path)
+            if self._expired(max(stat.st_atime, stat.st_mtime), now):
+                raise FileNotFoundError(path)
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(name, data, stat.st_mtime, now)
+            self._touch(name, now)
+        return data, stat.st_mtime
+
+    def put(self, name, data):
+        now = time.time()
+        if self.directory is None:
+            with self._lock:
+                self._remember(name, data, now, now)
+            return
+
+        path = self.path(name)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        stored = os.stat(path).st_mtime
+
+        with self._lock:
+            self._remember(name, data, stored, now)
+            self._disk_size += len(data) - replaced
+            if self._disk_size > self.disk_bytes:
+                self._evict_disk()
+
+    def collect(self):
+        """
+        Remove entries unused for longer than the TTL from both tiers.
+        :return: Number of removed entries
+        """
+        if self.ttl is None:
+            return 0
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for name in [name for name, entry in self._memory.items() if self._expired(entry[2], now)]:
+                del self._memory[name]
+                if self.directory is None:
+                    removed += 1
+            for path, size, used in self._disk_entries():
+                if self._expired(used, now):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        continue
+                    self._disk_size -= size
+                    self._memory.pop(os.path.basename(path), None)
+                    removed += 1
+            self.expirations += removed
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'memory_evictions': self.memory_evictions,
+                'expirations': self.expirations,
+                'memory_items': len(self._memory),
+                'disk_bytes': self._disk_size,
+            }
+
+    def _expired(self, used, now):
+        return self.ttl is not None and now - used > self.ttl
+
+    def _touch(self, name, now):
+        # Only the access time moves, the modification time is the time the entry was stored
+        if self.directory is None:
+            return
+        path = self.path(name)
+        try:
+            os.utime(path, (now, os.stat(path).st_mtime))
+        except FileNotFoundError:
+            pass
+
+    def _remember(self, name, data, stored, used):
+        self._memory[name] = (data, stored, used)
+        self._memory.move_to_end(name)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self.memory_evictions += 1
+
+    def _disk_entries(self):
+        entries = []
+        if self.directory is None:
+            return entries
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, max(stat.st_atime, stat.st_mtime)))
+        return entries
+
+    def _evict_disk(self):
+        # Least recently used files go first, hits refresh the access time
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        self._disk_size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._disk_size <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._disk_size -= size
+            self.evictions += 1
+            self._memory.pop(os.path.basename(path), None)
+
+    def _collect_periodically(self, interval):
+        while True:
+            time.sleep(interval)
+            self.collect()
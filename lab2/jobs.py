@@ -0,0 +1,160 @@
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pipeline import Timings, process_bytes
+
+
+class QueueFull(Exception):
+    pass
+
+
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _run_job(job_id, data, methods, ext, quality):
+    def report(done, total):
+        _progress_queue.put((job_id, done, total))
+
+    timings = Timings()
+    encoded = process_bytes(data, methods, ext, on_stage=report, timings=timings, quality=quality)
+    return encoded, timings.steps, timings.peak_bytes
+
+
+class JobQueue:
+    """
+    Runs processing jobs in the background on a local process pool.
+    Finished results are stored in the result cache under the job's result name.
+    :param cache: ResultCache receiving the encoded results
+    :param max_workers: Number of worker processes, all cores by default
+    :param max_pending: Maximum number of queued and running jobs
+    :param keep_finished: Number of finished jobs whose status is remembered
+    :param on_timings: Optional callback (steps, peak_bytes) receiving the timings of every job
+    """
+
+    def __init__(self, cache, max_workers=None, max_pending=16, keep_finished=256, on_timings=None):
+        self.cache = cache
+        self.on_timings = on_timings
+        self.max_workers = max_workers or os.cpu_count()
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._progress_queue = None
+
+    def submit(self, data, methods, ext, result_name, quality=None):
+        """
+        Queue a job, or finish it at once when the result is already cached.
+        :return: Job id
+        :raises QueueFull: When max_pending jobs are already queued or running
+        """
+        job_id = uuid.uuid4().hex
+        job = {'id': job_id, 'status': 'queued', 'progress': 0.0, 'result': None, 'error': None}
+
+        if self.cache.get(result_name) is not None:
+            job.update(status='done', progress=1.0, result=result_name)
+            with self._lock:
+                self._add(job)
+            return job_id
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"{self._pending} jobs are already pending.")
+            self._pending += 1
+            self._add(job)
+            executor = self._start()
+
+        try:
+            future = executor.submit(_run_job, job_id, data, methods, ext, quality)
+        except (BrokenProcessPool, RuntimeError) as error:
+            # A worker died (the OOM killer on a big scan), the next submit starts a new pool
+            self._drop(executor)
+            with self._lock:
+                self._pending -= 1
+                job.update(status='failed', error=str(error))
+            return job_id
+        future.add_done_callback(lambda f: self._finish(job, result_name, f, executor))
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+            self._progress_queue.put(None)
+
+    def _start(self):
+        # The pool is created on first use, so importing the app spawns no processes
+        if self._executor is None:
+            context = multiprocessing.get_context()
+            self._progress_queue = context.Queue()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                                 initializer=_init_worker,
+                                                 initargs=(self._progress_queue,))
+            threading.Thread(target=self._read_progress, args=(self._progress_queue,), daemon=True).start()
+        return self._executor
+
+    def _drop(self, executor):
+        # Forget a broken pool once, its progress reader stops with it
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            progress_queue = self._progress_queue
+        executor.shutdown(wait=False)
+        progress_queue.put(None)
+
+    def _read_progress(self, progress_queue):
+        while True:
+            message = progress_queue.get()
+            if message is None:
+                return
+            job_id, done, total = message
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None and job['status'] in ('queued', 'running'):
+                    job['status'] = 'running'
+                    job['progress'] = done / total
+
+    def _finish(self, job, result_name, future, executor):
+        # The job always leaves the pending count, a failing cache write (disk full) fails the job
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._drop(executor)
+        try:
+            if error is None:
+                encoded, steps, peak_bytes = future.result()
+                self.cache.put(result_name, encoded)
+                if self.on_timings is not None:
+                    self.on_timings(steps, peak_bytes)
+        except Exception as put_error:
+            error = put_error
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if error is None:
+                    job.update(status='done', progress=1.0, result=result_name)
+                else:
+                    job.update(status='failed', error=str(error))
+
+    def _add(self, job):
+        self._jobs[job['id']] = job
+        finished = [job_id for job_id, j in self._jobs.items() if j['status'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
@@ -0,0 +1,517 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+import cv2
+import numpy as np
+
+
+RED = (0, 0, 255)
+_TOKEN_UNSAFE = re.compile(r"[^!#$%&'*+\-.^_`|~0-9A-Za-z]")
+
+
+class Timings:
+    """
+    Wall-clock seconds of the pipeline steps of one request and the peak size
+    of the arrays it held. A stage's detect time includes the intermediates
+    it computes first, those are also reported on their own.
+    """
+
+    def __init__(self):
+        self.steps = {}
+        self.peak_bytes = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.steps[name] = self.steps.get(name, 0.0) + seconds
+
+    def note_bytes(self, nbytes):
+        with self._lock:
+            self.peak_bytes = max(self.peak_bytes, nbytes)
+
+    def server_timing(self):
+        # Metric names are HTTP tokens, so characters such as ':' in 'tiles:edges' become '_'
+        return ', '.join(f"{_TOKEN_UNSAFE.sub('_', name)};dur={seconds * 1000:.2f}"
+                         for name, seconds in self.steps.items())
+
+
+def _measure(timings, name):
+    return timings.measure(name) if timings is not None else nullcontext()
+
+
+class Frame:
+    """
+    Source image of one request plus the intermediates derived from it.
+    Every intermediate is computed at most once and shared by all stages.
+    While a stage runs inside reading(), it may only get the intermediates it
+    declared; the intermediates themselves get whatever they are built from.
+    :param stats: Whole-image statistics, set when the frame is one tile of a larger image
+    :param buffers: Optional dict of arrays reused as outputs from frame to frame
+    :param timings: Optional Timings receiving the time of every intermediate
+    """
+
+    def __init__(self, image, stats=None, buffers=None, timings=None):
+        self.image = image
+        self.stats = stats or {}
+        self.buffers = buffers
+        self.timings = timings
+        self.nbytes = 0
+        self._cache = {}
+        self._allowed = None
+        self._depth = 0
+
+    def get(self, name):
+        if self._allowed is not None and self._depth == 0 and name not in self._allowed:
+            raise RuntimeError(f"Intermediate '{name}' is not declared in the inputs {sorted(self._allowed)}")
+        if name not in self._cache:
+            self._depth += 1
+            try:
+                with _measure(self.timings, name):
+                    value = self._cache[name] = INTERMEDIATES[name](self)
+            finally:
+                self._depth -= 1
+            self.nbytes += value.nbytes
+        return self._cache[name]
+
+    @contextmanager
+    def reading(self, stage):
+        # Restricts get() to the intermediates the stage declared
+        previous, self._allowed = self._allowed, frozenset(stage.inputs)
+        try:
+            yield
+        finally:
+            self._allowed = previous
+
+    def out(self, name, dtype=np.uint8, channels=1):
+        """
+        Output array of the image size for an OpenCV dst argument.
+        :return: A reused buffer, or None to let OpenCV allocate when the frame has no buffers
+        """
+        if self.buffers is None:
+            return None
+        shape = self.image.shape[:2] if channels == 1 else self.image.shape[:2] + (channels,)
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = self.buffers[name] = np.empty(shape, dtype)
+        return buffer
+
+
+def _gray(frame):
+    return cv2.cvtColor(frame.image, cv2.COLOR_BGR2GRAY, dst=frame.out('gray'))
+
+
+def _canny(name, low, high):
+    def compute(frame):
+        return cv2.Canny(frame.get('gray'), low, high, edges=frame.out(name), apertureSize=3)
+    return compute
+
+
+def _sobel(frame):
+    gray = frame.get('gray')
+    grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, dst=frame.out('grad_x', np.float64), ksize=3)
+    grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, dst=frame.out('grad_y', np.float64), ksize=3)
+    magnitude = cv2.magnitude(grad_x, grad_y, magnitude=frame.out('magnitude', np.float64))
+    return cv2.convertScaleAbs(magnitude, dst=frame.out('sobel'))
+
+
+def _harris_response(frame):
+    gray = frame.get('gray')
+    gray_f32 = frame.out('gray_f32', np.float32)
+    if gray_f32 is None:
+        gray_f32 = np.float32(gray)
+    else:
+        np.copyto(gray_f32, gray)
+    return cv2.cornerHarris(gray_f32, blockSize=2, ksize=3, k=0.04, dst=frame.out('harris_response', np.float32))
+
+
+def _harris(frame):
+    return cv2.dilate(frame.get('harris_response'), None, dst=frame.out('harris', np.float32))
+
+
+INTERMEDIATES = {
+    'gray': _gray,
+    'harris_response': _harris_response,
+    'harris': _harris,
+    'canny_lines': _canny('canny_lines', 50, 150),
+    'canny_edges': _canny('canny_edges', 100, 200),
+    'sobel': _sobel,
+}
+
+
+class Stage:
+    """
+    One processing method of the pipeline. The intermediates it reads are
+    computed on first use by Frame.get and shared with the other stages.
+    :param inputs: Names of the intermediates detect, describe and tile_stat read,
+                   Frame.get rejects any other
+    :param output: 'overlay' draws on top of the current result,
+                   'image' replaces the current result
+    :param detect: Function (frame) -> detections
+    :param render: Function (canvas, detections) -> new canvas
+    :param halo: Border in pixels a tile needs for exact results, None for global stages
+    :param tile_stat: Optional function (frame, interior) -> value, the maximum over
+                      all tiles is passed to detect as frame.stats[name]
+    :param describe: Function (frame, detections) -> dict of arrays, the compact
+                     form of the detections returned without drawing
+    """
+
+    def __init__(self, name, inputs, output, detect, render, halo=None, tile_stat=None, describe=None):
+        self.name = name
+        self.inputs = inputs
+        self.output = output
+        self.detect = detect
+        self.render = render
+        self.halo = halo
+        self.tile_stat = tile_stat
+        self.describe = describe or describe_mask
+
+
+def _mask_to_bgr(canvas, mask):
+    # The mask replaces the result, so the canvas is overwritten in place
+    return cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR, dst=canvas)
+
+
+def detect_corners_mask(frame):
+    dst = frame.get('harris')
+    peak = frame.stats.get('corners', dst.max())
+    return dst > 0.01 * peak
+
+
+def harris_peak(frame, interior):
+    return frame.get('harris')[interior].max()
+
+
+def describe_corners(frame, mask):
+    # Corners are the local maxima of the response inside the dilated mask
+    peaks = mask & (frame.get('harris_response') == frame.get('harris'))
+    ys, xs = np.nonzero(peaks)
+    return {'points': np.stack([xs, ys], axis=1).astype(np.int32)}
+
+
+def draw_corners(canvas, mask):
+    canvas[mask] = RED
+    return canvas
+
+
+def detect_lines_polar(frame):
+    lines = cv2.HoughLines(frame.get('canny_lines'), 1, np.pi / 180, 100)
+    if lines is None:
+        return np.empty((0, 2), np.float32)
+    return lines.reshape(-1, 2)
+
+
+def describe_lines(frame, lines):
+    return {'lines': lines.astype(np.float32)}
+
+
+def draw_lines(canvas, lines):
+    for rho, theta in lines:
+        a = np.cos(theta)
+        b = np.sin(theta)
+        x0 = a * rho
+        y0 = b * rho
+        x1 = int(x0 + 1000 * (-b))
+        y1 = int(y0 + 1000 * (a))
+        x2 = int(x0 - 1000 * (-b))
+        y2 = int(y0 - 1000 * (a))
+        cv2.line(canvas, (x1, y1), (x2, y2), RED, 2)
+    return canvas
+
+
+def describe_mask(frame, mask):
+    count = int(np.count_nonzero(mask))
+    return {
+        'count': np.int64(count),
+        'fraction': np.float64(count / mask.size),
+        'mask': np.packbits(mask > 0, axis=1),
+    }
+
+
+def detect_edges_mask(frame):
+    return frame.get('canny_edges')
+
+
+def detect_brightness_mask(frame):
+    _, thresh = cv2.threshold(frame.get('sobel'), 50, 255, cv2.THRESH_BINARY, dst=frame.out('brightness'))
+    return thresh
+
+
+MORPHOLOGY_KERNEL = np.ones((5, 5), np.uint8)
+
+
+def detect_morphology_mask(frame):
+    _, thresh = cv2.threshold(frame.get('gray'), 180, 255, cv2.THRESH_BINARY, dst=frame.out('threshold'))
+    return cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, MORPHOLOGY_KERNEL, dst=frame.out('morphology'))
+
+
+def create_blob_detector():
+    params = cv2.SimpleBlobDetector_Params()
+    params.filterByArea = True
+    params.minArea = 100
+    params.filterByCircularity = False
+    params.filterByConvexity = False
+    params.filterByInertia = False
+    return cv2.SimpleBlobDetector_create(params)
+
+
+_local = threading.local()
+
+
+def blob_detector():
+    # Created once per thread and reused for every image and video frame
+    detector = getattr(_local, 'blob_detector', None)
+    if detector is None:
+        detector = _local.blob_detector = create_blob_detector()
+    return detector
+
+
+def detect_keypoints(frame):
+    return blob_detector().detect(frame.get('gray'))
+
+
+def describe_keypoints(frame, keypoints):
+    blobs = np.array([(kp.pt[0], kp.pt[1], kp.size) for kp in keypoints], np.float32)
+    return {'blobs': blobs.reshape(-1, 3)}
+
+
+def draw_keypoints(canvas, keypoints):
+    return cv2.drawKeypoints(canvas, keypoints, canvas, RED,
+                             cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS)
+
+
+STAGES = {
+    'corners': Stage('corners', ['harris', 'harris_response'], 'overlay', detect_corners_mask, draw_corners,
+                     halo=4, tile_stat=harris_peak, describe=describe_corners),
+    'lines': Stage('lines', ['canny_lines'], 'overlay', detect_lines_polar, draw_lines,
+                   describe=describe_lines),
+    # Canny hysteresis can follow an edge across any distance, so no halo makes tiles exact
+    'edges': Stage('edges', ['canny_edges'], 'image', detect_edges_mask, _mask_to_bgr),
+    'morphology': Stage('morphology', ['gray'], 'image', detect_morphology_mask, _mask_to_bgr, halo=4),
+    'brightness': Stage('brightness', ['sobel'], 'image', detect_brightness_mask, _mask_to_bgr, halo=2),
+    'points': Stage('points', ['gray'], 'overlay', detect_keypoints, draw_keypoints,
+                    describe=describe_keypoints),
+}
+
+
+def run_pipeline(img, methods, on_stage=None, buffers=None, timings=None):
+    """
+    Run the selected methods over one image.
+    All stages analyse the source image, so gray, Canny and Sobel are
+    computed once per request; the results are composed in method order.
+    :param img: BGR image
+    :param methods: List of method names, unknown names are ignored
+    :param on_stage: Optional callback (done, total) called after every stage
+    :param buffers: Optional dict of arrays reused between calls, the result is one of them
+    :param timings: Optional Timings receiving the time of every step
+    :return: Resulting BGR image
+    """
+    frame = Frame(img, buffers=buffers, timings=timings)
+    stages = [STAGES[method] for method in methods if method in STAGES]
+    canvas = frame.out('canvas', channels=3)
+    if stages and stages[0].output == 'image':
+        # The first stage replaces the whole result, so the source is not copied
+        if canvas is None:
+            canvas = np.empty_like(img)
+    elif canvas is None:
+        canvas = img.copy()
+    else:
+        np.copyto(canvas, img)
+    for done, stage in enumerate(stages, start=1):
+        canvas = _run_stage(stage, frame, canvas, timings)
+        if on_stage is not None:
+            on_stage(done, len(stages))
+    if timings is not None:
+        timings.note_bytes(img.nbytes + canvas.nbytes + frame.nbytes)
+    return canvas
+
+
+def _run_stage(stage, frame, canvas, timings):
+    with _measure(timings, f'{stage.name}.detect'), frame.reading(stage):
+        detections = stage.detect(frame)
+    with _measure(timings, f'{stage.name}.draw'):
+        return stage.render(canvas, detections)
+
+
+def run_detections(img, methods, timings=None):
+    """
+    Detect without drawing or encoding anything.
+    :param img: BGR image
+    :param methods: List of method names, unknown names and repeats are ignored
+    :param timings: Optional Timings receiving the time of every step
+    :return: Dict method -> dict of NumPy arrays, see the describe functions
+    """
+    frame = Frame(img, timings=timings)
+    results = {}
+    for method in methods:
+        stage = STAGES.get(method)
+        if stage is not None and method not in results:
+            with _measure(timings, f'{method}.detect'), frame.reading(stage):
+                results[method] = stage.describe(frame, stage.detect(frame))
+    if timings is not None:
+        timings.note_bytes(img.nbytes + frame.nbytes)
+    return results
+
+
+# Images larger than this are processed in tiles, with intermediates bounded by TILE_MEMORY_BYTES
+TILE_ABOVE_PIXELS = 40 * 1000 * 1000
+TILE_MEMORY_BYTES = 512 * 1024 * 1024
+# Working memory of one tile pixel, dominated by the two CV_64F Sobel gradients
+TILE_BYTES_PER_PIXEL = 48
+
+
+def tile_size(memory_bytes, workers, halo):
+    side = int((memory_bytes / workers / TILE_BYTES_PER_PIXEL) ** 0.5) - 2 * halo
+    return max(side, 64)
+
+
+def _tiles(height, width, size):
+    for y in range(0, height, size):
+        for x in range(0, width, size):
+            yield y, x, min(y + size, height), min(x + size, width)
+
+
+def _tile_frame(img, tile, halo, stats=None):
+    y0, x0, y1, x1 = tile
+    top, left = max(y0 - halo, 0), max(x0 - halo, 0)
+    bottom, right = min(y1 + halo, img.shape[0]), min(x1 + halo, img.shape[1])
+    interior = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+    return Frame(img[top:bottom, left:right], stats), (slice(top, bottom), slice(left, right)), interior
+
+
+def _tile_stats(img, tile, halo, stages):
+    frame, _, interior = _tile_frame(img, tile, halo)
+    stats = {}
+    for stage in stages:
+        with frame.reading(stage):
+            stats[stage.name] = stage.tile_stat(frame, interior)
+    return stats
+
+
+def _render_tile(img, canvas, tile, halo, stages, stats):
+    frame, window, interior = _tile_frame(img, tile, halo, stats)
+    # Overlay stages only touch their own pixels, so a neighbour writing the halo is harmless
+    if stages[0].output == 'image':
+        tile_canvas = np.empty(frame.image.shape, frame.image.dtype)
+    else:
+        tile_canvas = canvas[window].copy()
+    for stage in stages:
+        with frame.reading(stage):
+            detections = stage.detect(frame)
+        tile_canvas = stage.render(tile_canvas, detections)
+    y0, x0, y1, x1 = tile
+    canvas[y0:y1, x0:x1] = tile_canvas[interior]
+    return frame.nbytes + tile_canvas.nbytes
+
+
+def _group_stages(stages):
+    # Consecutive local stages share one pass over the tiles, global stages run alone
+    groups = []
+    for stage in stages:
+        if stage.halo is not None and groups and groups[-1][0].halo is not None:
+            groups[-1].append(stage)
+        else:
+            groups.append([stage])
+    return groups
+
+
+def run_tiled(img, methods, memory_bytes=TILE_MEMORY_BYTES, workers=None, on_stage=None, timings=None):
+    """
+    Run the selected methods tile by tile, with the same result as run_pipeline.
+    Local stages see each tile plus a halo sized to their kernels, tiles run in
+    parallel and their intermediates stay within memory_bytes. Global stages
+    (Hough lines, blobs, Canny edges) fall back to the whole image.
+    :param img: BGR image
+    :param methods: List of method names, unknown names are ignored
+    :param memory_bytes: Bound on the intermediates of all tiles in flight
+    :param workers: Number of tiles processed in parallel, all cores by default
+    :param on_stage: Optional callback (done, total) called after every stage
+    :param timings: Optional Timings, a pass over the tiles is reported as one step
+    :return: Resulting BGR image
+    """
+    workers = workers or os.cpu_count()
+    stages = [STAGES[method] for method in methods if method in STAGES]
+    canvas = img.copy()
+    full_frame = None
+    tiles_bytes = 0
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for group in _group_stages(stages):
+            if group[0].halo is None:
+                if full_frame is None:
+                    full_frame = Frame(img, timings=timings)
+                canvas = _run_stage(group[0], full_frame, canvas, timings)
+            else:
+                halo = max(stage.halo for stage in group)
+                tiles = list(_tiles(img.shape[0], img.shape[1], tile_size(memory_bytes, workers, halo)))
+
+                stats = {}
+                stat_stages = [stage for stage in group if stage.tile_stat is not None]
+                if stat_stages:
+                    for values in executor.map(lambda tile: _tile_stats(img, tile, halo, stat_stages), tiles):
+                        for name, value in values.items():
+                            stats[name] = max(stats.get(name, value), value)
+
+                with _measure(timings, 'tiles:' + '+'.join(stage.name for stage in group)):
+                    sizes = list(executor.map(lambda tile: _render_tile(img, canvas, tile, halo, group, stats), tiles))
+                tiles_bytes = max(tiles_bytes, max(sizes) * min(workers, len(tiles)))
+
+            for _ in group:
+                done += 1
+                if on_stage is not None:
+                    on_stage(done, len(stages))
+    if timings is not None:
+        timings.note_bytes(img.nbytes + canvas.nbytes + tiles_bytes + (full_frame.nbytes if full_frame else 0))
+    return canvas
+
+
+def decode_image(data):
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode the uploaded image. Ensure the file is an image and in a supported format.")
+    return img
+
+
+ENCODE_QUALITY_FLAGS = {
+    '.jpg': cv2.IMWRITE_JPEG_QUALITY,
+    '.jpeg': cv2.IMWRITE_JPEG_QUALITY,
+    '.png': cv2.IMWRITE_PNG_COMPRESSION,
+    '.webp': cv2.IMWRITE_WEBP_QUALITY,
+}
+
+
+def encode_image(img, ext, quality=None):
+    """
+    Encode an image into the format of ext.
+    :param quality: JPEG or WebP quality, PNG compression level, None for the OpenCV default
+    """
+    params = []
+    if quality is not None and ext in ENCODE_QUALITY_FLAGS:
+        params = [ENCODE_QUALITY_FLAGS[ext], int(quality)]
+    ok, encoded = cv2.imencode(ext, img, params)
+    if not ok:
+        raise ValueError(f"Could not encode the result as {ext}.")
+    return encoded.tobytes()
+
+
+def process_bytes(data, methods, ext, on_stage=None, timings=None, quality=None):
+    with _measure(timings, 'decode'):
+        img = decode_image(data)
+    if img.shape[0] * img.shape[1] > TILE_ABOVE_PIXELS:
+        result = run_tiled(img, methods, on_stage=on_stage, timings=timings)
+    else:
+        result = run_pipeline(img, methods, on_stage, timings=timings)
+    with _measure(timings, 'encode'):
+        return encode_image(result, ext, quality)
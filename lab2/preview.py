@@ -0,0 +1,147 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from pipeline import decode_image
+
+
+PREVIEW_SIDE = 800
+PYRAMID_MIN_SIDE = 256
+
+
+def build_pyramid(img, side=PYRAMID_MIN_SIDE):
+    """
+    Halve the image with pyrDown until its longer side fits into side.
+    :return: List of levels, level n is 2**n times smaller than the original
+    """
+    levels = [img]
+    while max(levels[-1].shape[:2]) > side:
+        levels.append(cv2.pyrDown(levels[-1]))
+    return levels
+
+
+def pick_level(shapes, side):
+    # The largest level that still fits, so a bigger side gives a sharper preview
+    for index, shape in enumerate(shapes):
+        if max(shape[:2]) <= side:
+            return index
+    return len(shapes) - 1
+
+
+def rescale_detections(results, scale):
+    """
+    Map detections found on a pyramid level back to full-resolution coordinates.
+    pyrDown centres level pixel x on original pixel 2x, so positions, Hough rho
+    and blob sizes scale linearly and theta is unchanged.
+    :param results: Dict method -> dict of arrays from run_detections
+    :param scale: Size ratio of the original to the level
+    :return: Rescaled copy; bit masks stay at level resolution and are dropped
+    """
+    rescaled = {}
+    for method, values in results.items():
+        out = {}
+        for name, value in values.items():
+            if name == 'points':
+                out[name] = (value * scale).astype(np.int32)
+            elif name == 'lines':
+                out[name] = value * np.array([scale, 1], np.float32)
+            elif name == 'blobs':
+                out[name] = value * np.float32(scale)
+            elif name == 'count':
+                out[name] = np.int64(round(int(value) * scale * scale))
+            elif name != 'mask':
+                out[name] = value
+        rescaled[method] = out
+    return rescaled
+
+
+class PreviewStore:
+    """
+    Keeps the pyramids of recent uploads, so tuning the methods on a preview
+    needs neither a new upload nor a new decode.
+    Level 0 is not kept: it is as large as the upload decoded, and it is
+    decoded again from the upload bytes when it is asked for.
+    :param max_uploads: Number of uploads kept, least recently used go first
+    :param max_bytes: Bound on the upload bytes, pyramid levels and encoded previews
+                      of all uploads; the newest upload is kept even if it is larger alone
+    :param max_previews: Encoded previews kept per upload, least recently used go first
+    """
+
+    def __init__(self, max_uploads=8, max_bytes=256 * 1024 * 1024, max_previews=16):
+        self.max_uploads = max_uploads
+        self.max_bytes = max_bytes
+        self.max_previews = max_previews
+        self.nbytes = 0
+        self._uploads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, data, ext, img):
+        upload_id = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if upload_id in self._uploads:
+                self._uploads.move_to_end(upload_id)
+                return upload_id
+        levels = build_pyramid(img)
+        record = {
+            'id': upload_id,
+            'data': data,
+            'ext': ext,
+            'shapes': [level.shape for level in levels],
+            'levels': [None] + levels[1:],
+            'previews': OrderedDict(),
+            'nbytes': len(data) + sum(level.nbytes for level in levels[1:]),
+        }
+        with self._lock:
+            # A concurrent add of the same bytes may have stored it meanwhile, its previews are kept
+            if upload_id in self._uploads:
+                self._uploads.move_to_end(upload_id)
+                return upload_id
+            self._uploads[upload_id] = record
+            self.nbytes += record['nbytes']
+            self._evict()
+        return upload_id
+
+    def get(self, upload_id):
+        with self._lock:
+            record = self._uploads.get(upload_id)
+            if record is not None:
+                self._uploads.move_to_end(upload_id)
+            return record
+
+    def level(self, record, index):
+        """
+        Image of one pyramid level, level 0 is decoded from the upload bytes.
+        :return: BGR image
+        """
+        return record['levels'][index] if index else decode_image(record['data'])
+
+    def get_preview(self, record, key):
+        with self._lock:
+            encoded = record['previews'].get(key)
+            if encoded is not None:
+                record['previews'].move_to_end(key)
+            return encoded
+
+    def put_preview(self, record, key, encoded):
+        with self._lock:
+            previews = record['previews']
+            # A record evicted meanwhile no longer counts towards the store
+            if key in previews or self._uploads.get(record['id']) is not record:
+                return
+            previews[key] = encoded
+            record['nbytes'] += len(encoded)
+            self.nbytes += len(encoded)
+            while len(previews) > self.max_previews:
+                _, old = previews.popitem(last=False)
+                record['nbytes'] -= len(old)
+                self.nbytes -= len(old)
+            self._evict()
+
+    def _evict(self):
+        # Caller holds the lock
+        while len(self._uploads) > self.max_uploads or (self.nbytes > self.max_bytes and len(self._uploads) > 1):
+            _, old = self._uploads.popitem(last=False)
+            self.nbytes -= old['nbytes']
@@ -0,0 +1,158 @@
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from pipeline import run_pipeline
+
+
+BOUNDARY = 'frame'
+MJPEG_MIMETYPE = f'multipart/x-mixed-replace; boundary={BOUNDARY}'
+
+
+def open_video(path):
+    """
+    Open a video file for reading.
+    :return: Frame rate (0 when unknown) and a generator of BGR frames
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        capture.release()
+        raise ValueError(f"Could not open video at {path}. Ensure the file is a video in a supported format.")
+
+    def frames():
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield frame
+        finally:
+            capture.release()
+
+    return capture.get(cv2.CAP_PROP_FPS) or 0, frames()
+
+
+def iter_mjpeg_frames(stream, chunk_size=64 * 1024):
+    """
+    Yield the frames of an MJPEG byte stream, such as a multipart/x-mixed-replace upload.
+    JPEG images are cut out by their SOI and EOI markers, part headers are skipped.
+    """
+    buffer = bytearray()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+        while True:
+            start = buffer.find(b'\xff\xd8')
+            if start < 0:
+                # Keep a trailing 0xff, it may start the next marker
+                del buffer[:max(len(buffer) - 1, 0)]
+                break
+            end = buffer.find(b'\xff\xd9', start + 2)
+            if end < 0:
+                del buffer[:start]
+                break
+            frame = cv2.imdecode(np.frombuffer(buffer, np.uint8, end + 2 - start, start), cv2.IMREAD_COLOR)
+            del buffer[:end + 2]
+            if frame is not None:
+                yield frame
+
+
+class StreamProcessor:
+    """
+    Runs the pipeline over a sequence of frames and produces MJPEG parts.
+    Buffers and the blob detector are reused from frame to frame. In real-time
+    mode a reader thread keeps only the newest frame, so frames that arrive while
+    the previous one is processed are dropped and counted.
+    :param methods: List of method names
+    :param realtime: Drop frames to keep up with the source instead of processing all of them
+    :param quality: JPEG quality of the output frames
+    """
+
+    def __init__(self, methods, realtime=True, quality=80):
+        self.methods = methods
+        self.realtime = realtime
+        self.quality = quality
+        self.buffers = {}
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self._stop = threading.Event()
+
+    def run(self, frames, fps=0):
+        """
+        Process frames and yield MJPEG parts until the source ends or the client disconnects.
+        :param frames: Iterable of BGR frames
+        :param fps: Frame rate the source is played back at, 0 reads it as fast as possible
+        """
+        handoff = queue.Queue(maxsize=1 if self.realtime else 2)
+        reader = threading.Thread(target=self._read, args=(frames, fps, handoff), daemon=True)
+        reader.start()
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        try:
+            while True:
+                frame = handoff.get()
+                if frame is None:
+                    return
+                result = run_pipeline(frame, self.methods, buffers=self.buffers)
+                ok, encoded = cv2.imencode('.jpg', result, params)
+                if not ok:
+                    continue
+                self.processed += 1
+                yield self._part(encoded)
+        finally:
+            self._stop.set()
+            reader.join()
+
+    def stats(self):
+        return {'received': self.received, 'processed': self.processed, 'dropped': self.dropped}
+
+    def _read(self, frames, fps, handoff):
+        started = time.perf_counter()
+        try:
+            for index, frame in enumerate(frames):
+                if self._stop.is_set():
+                    return
+                if fps:
+                    delay = started + index / fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                self.received += 1
+                self._offer(handoff, frame)
+        finally:
+            self._offer(handoff, None)
+            close = getattr(frames, 'close', None)
+            if close is not None:
+                close()
+
+    def _offer(self, handoff, frame):
+        if self.realtime and frame is not None:
+            # Replace a frame still waiting to be processed instead of blocking the source
+            while True:
+                try:
+                    handoff.put_nowait(frame)
+                    return
+                except queue.Full:
+                    try:
+                        handoff.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+        while not self._stop.is_set():
+            try:
+                handoff.put(frame, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _part(self, encoded):
+        header = (f'--{BOUNDARY}\r\n'
+                  f'Content-Type: image/jpeg\r\n'
+                  f'Content-Length: {len(encoded)}\r\n'
+                  f'X-Frame-Index: {self.processed}\r\n'
+                  f'X-Dropped-Frames: {self.dropped}\r\n\r\n')
+        return header.encode() + encoded.tobytes() + b'\r\n'
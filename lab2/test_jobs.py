@@ -0,0 +1,42 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+import jobs
+from cache import ResultCache
+from jobs import JobQueue
+
+
+def _crash(*args):
+    # Stands in for a worker killed by the OOM killer
+    os._exit(1)
+
+
+def _wait(queue, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.status(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish: {queue.status(job_id)}")
+
+
+def test_queue_recovers_from_a_killed_worker(monkeypatch):
+    queue = JobQueue(ResultCache(None), max_workers=1, max_pending=2)
+    data = cv2.imencode('.png', np.zeros((32, 32, 3), np.uint8))[1].tobytes()
+    try:
+        monkeypatch.setattr(jobs, '_run_job', _crash)
+        crashed = _wait(queue, queue.submit(data, ['edges'], '.png', 'crashed.png'))
+        assert crashed['status'] == 'failed'
+
+        monkeypatch.undo()
+        # More jobs than max_pending: a leaked pending count would raise QueueFull
+        for index in range(3):
+            job = _wait(queue, queue.submit(data, ['edges'], '.png', f'result{index}.png'))
+            assert job['status'] == 'done', job
+        assert queue._pending == 0
+    finally:
+        queue.shutdown()
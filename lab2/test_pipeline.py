@@ -0,0 +1,32 @@
+import cv2
+import numpy as np
+import pytest
+
+import pipeline
+from pipeline import STAGES, Frame, Stage
+
+
+def _image():
+    img = np.zeros((96, 128, 3), np.uint8)
+    cv2.rectangle(img, (20, 20), (70, 60), (255, 255, 255), -1)
+    cv2.circle(img, (100, 50), 15, (200, 200, 200), -1)
+    return img
+
+
+def test_stages_read_only_declared_inputs():
+    # Frame.get raises for an undeclared intermediate, so every path must run clean
+    img = _image()
+    methods = list(STAGES)
+    pipeline.run_pipeline(img, methods)
+    pipeline.run_detections(img, methods)
+    pipeline.run_tiled(img, methods, memory_bytes=1024 * 1024, workers=2)
+
+
+def test_undeclared_input_is_rejected():
+    stage = Stage('probe', ['gray'], 'image', lambda frame: frame.get('sobel'), pipeline._mask_to_bgr)
+    frame = Frame(_image())
+    with pytest.raises(RuntimeError), frame.reading(stage):
+        stage.detect(frame)
+    # Intermediates still build on the ones they need
+    with frame.reading(STAGES['corners']):
+        frame.get('harris')
@@ -1,251 +1,291 @@
 from PIL import Image, ImageDraw
 import base64
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from io import BytesIO
-
-def execute_algorithm(algorithm, params):
+import numpy as np
+from steps import polygon_vertices
+from raster import (Canvas, dda_points, bresenham_line_points, circle_points, ellipse_points, polygon_points,
+                    circle_spans, ellipse_spans, polygon_spans)
+
+# Наибольшая сторона итогового изображения (холст, умноженный на масштаб)
+MAX_IMAGE_SIDE = 8192
+# При меньшем масштабе сетка по умолчанию не рисуется, она закрыла бы весь холст
+MIN_GRID_SCALE = 4
+OUTPUTS = ('base64', 'png', 'rgba')
+
+def execute_algorithm(algorithm, params, **options):
     if algorithm == 'step_by_step':
-        return step_by_step_algorithm(params)
+        return step_by_step_algorithm(params, **options)
     elif algorithm == 'dda':
-        return dda_algorithm(params)
+        return dda_algorithm(params, **options)
     elif algorithm == 'bresenham_line':
-        return bresenham_line_algorithm(params)
+        return bresenham_line_algorithm(params, **options)
     elif algorithm == 'bresenham_circle':
-        return bresenham_circle_algorithm(params)
+        return bresenham_circle_algorithm(params, **options)
     elif algorithm == 'bresenham_ellipse':
-        return bresenham_ellipse_algorithm(params)
+        return bresenham_ellipse_algorithm(params, **options)
+    elif algorithm == 'polygon':
+        return polygon_algorithm(params, **options)
     else:
-        return 'Неизвестный алгоритм'
+        raise ValueError(f"Неизвестный алгоритм: {algorithm}")
+
+def create_image(width=50, height=50):
+    # Создаем пустой холст (по умолчанию 50x50) с белым фоном, точки пишутся в массив NumPy
+    return Canvas(width, height, 'white')
+
+
+def check_options(width=50, height=50, scale_factor=10, grid=None, output='base64'):
+    """
+    Validate the canvas and output options of a render.
+    :param grid: Draw the coordinate grid, None draws it from MIN_GRID_SCALE on
+    :param output: 'base64' PNG string, 'png' bytes or raw 'rgba' bytes
+    :return: Dict of normalized options for render_primitives
+    :raises ValueError: For a non-positive size or scale, an image side over MAX_IMAGE_SIDE or an unknown output
+    """
+    width, height, scale_factor = int(width), int(height), int(scale_factor)
+    if min(width, height, scale_factor) < 1:
+        raise ValueError("Размер холста и масштаб должны быть положительными")
+    if max(width, height) * scale_factor > MAX_IMAGE_SIDE:
+        raise ValueError(f"Сторона изображения больше {MAX_IMAGE_SIDE} пикселей")
+    if output not in OUTPUTS:
+        raise ValueError(f"Неизвестный формат: {output}")
+    if grid is None:
+        grid = scale_factor >= MIN_GRID_SCALE
+    return {'width': width, 'height': height, 'scale_factor': scale_factor, 'grid': is_true(grid), 'output': output}
+
+
+def scale_image(canvas, scale_factor=10, grid=True):
+    """
+    Upscale the canvas and put the coordinate grid over it.
+    :return: RGB array of shape (height * scale_factor, width * scale_factor, 3)
+    """
+    # Увеличиваем изображение повторением пикселей (как NEAREST) для сохранения резкости
+    pixels = np.repeat(np.repeat(canvas.pixels, scale_factor, axis=1), scale_factor, axis=0)
+
+    # Накладываем координатную сетку, построенную один раз для этого размера
+    if grid:
+        rows, cols, row_pixels, col_pixels = grid_overlay(canvas.width, canvas.height, scale_factor)
+        pixels[:, cols] = col_pixels
+        pixels[rows] = row_pixels
+    return pixels
+
+
+def encode_png(pixels):
+    buffered = BytesIO()
+    Image.fromarray(pixels, 'RGB').save(buffered, format="PNG")
+    return buffered.getvalue()
 
-def create_image():
-    # Создаем пустое изображение 50x50 с белым фоном
-    img = Image.new('RGB', (50, 50), 'white')
-    
-    return img
 
+def encode_rgba(pixels):
+    rgba = np.empty(pixels.shape[:2] + (4,), np.uint8)
+    rgba[..., :3] = pixels
+    rgba[..., 3] = 255
+    return rgba.tobytes()
 
-def get_image_data(img):
-    # Коэффициент масштабирования
-    scale_factor = 10  # 50x10 = 500 пикселей
 
-    # Увеличиваем изображение с использованием NEAREST (ближайшего соседа) для сохранения резкости
-    img = img.resize((img.width * scale_factor, img.height * scale_factor), Image.NEAREST)
-    
-    # Добавляем координатную сетку
-    draw = ImageDraw.Draw(img)
-
-    # Рисуем вертикальные линии на каждой границе пикселей
-    for x in range(1, img.width, scale_factor):
-        draw.line([(x, 0), (x, img.height)], fill='lightgray')
-    draw.line([(0, 0), (0, img.height)], fill='black')
-    draw.line([(0, 0), (img.width, 0)], fill='black')
-
-    # Рисуем горизонтальные линии на каждой границе пикселей
-    for y in range(1, img.height, scale_factor):
-        draw.line([(0, y), (img.width, y)], fill='lightgray')
+def get_image_data(canvas, scale_factor=10, grid=True):
+    # Коэффициент масштабирования: 50x10 = 500 пикселей
+    pixels = scale_image(canvas, scale_factor, grid)
 
     # Преобразуем изображение в base64 для отображения на веб-странице
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
+    img_str = base64.b64encode(encode_png(pixels)).decode()
     return img_str
 
 
-def step_by_step_algorithm(params):
-    x1 = int(params.get('x1', 0))
-    y1 = int(params.get('y1', 0))
-    x2 = int(params.get('x2', 0))
-    y2 = int(params.get('y2', 0))
+@lru_cache(maxsize=4)
+def grid_overlay(width, height, scale_factor):
+    """
+    Draw the coordinate grid of a scaled canvas once.
+    Every grid line spans the whole image, so copying the grid rows and columns
+    of the overlay gives the same pixels as drawing the lines on each result.
+    :return: Tuple (grid rows, grid columns, RGB pixels of those rows, RGB pixels of those columns)
+    """
+    overlay = Image.new('RGBA', (width * scale_factor, height * scale_factor), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
 
-    img = create_image()
-    draw = ImageDraw.Draw(img)
+    # Рисуем вертикальные линии на каждой границе пикселей
+    for x in range(1, overlay.width, scale_factor):
+        draw.line([(x, 0), (x, overlay.height)], fill='lightgray')
+    draw.line([(0, 0), (0, overlay.height)], fill='black')
+    draw.line([(0, 0), (overlay.width, 0)], fill='black')
 
-    dx = x2 - x1
-    dy = y2 - y1
+    # Рисуем горизонтальные линии на каждой границе пикселей
+    for y in range(1, overlay.height, scale_factor):
+        draw.line([(0, y), (overlay.width, y)], fill='lightgray')
 
-    steps = max(abs(dx), abs(dy))
+    # Храним только строки и столбцы сетки, а не всё изображение
+    rgba = np.asarray(overlay)
+    drawn = rgba[..., 3] > 0
+    rows = np.flatnonzero(drawn.all(axis=1))
+    cols = np.flatnonzero(drawn.all(axis=0))
+    row_pixels = rgba[rows, :, :3]
+    col_pixels = rgba[:, cols, :3]
+    row_pixels.flags.writeable = False
+    col_pixels.flags.writeable = False
+    return rows, cols, row_pixels, col_pixels
 
-    if steps == 0:
-        draw.point((x1, y1), fill='black')
-    else:
-        x_inc = dx / steps
-        y_inc = dy / steps
 
-        x = x1
-        y = y1
+def line_endpoints(params, default_start, default_end):
+    x1 = int(params.get('x1', default_start))
+    y1 = int(params.get('y1', default_start))
+    x2 = int(params.get('x2', default_end))
+    y2 = int(params.get('y2', default_end))
+    return x1, y1, x2, y2
 
-        for _ in range(steps + 1):
-            draw.point((round(x), round(y)), fill='black')
-            x += x_inc
-            y += y_inc
 
-    img_str = get_image_data(img)
-    return img_str
+def step_by_step_points(params):
+    return dda_points(*line_endpoints(params, 0, 0))
 
-def dda_algorithm(params):
-    x1 = int(params.get('x1', 5))
-    y1 = int(params.get('y1', 5))
-    x2 = int(params.get('x2', 45))
-    y2 = int(params.get('y2', 45))
+def dda_line_points(params):
+    return dda_points(*line_endpoints(params, 5, 45))
 
-    img = create_image()
-    draw = ImageDraw.Draw(img)
+def bresenham_points(params):
+    return bresenham_line_points(*line_endpoints(params, 5, 45))
 
-    dx = x2 - x1
+def circle_args(params):
+    xc = int(params.get('xc', 25))
+    yc = int(params.get('yc', 25))
+    r = int(params.get('radius', 20))
+    return xc, yc, r
 
-    dy = y2 - y1
+def ellipse_args(params):
+    xc = int(params.get('xc', 25))
+    yc = int(params.get('yc', 25))
+    rx = int(params.get('rx', 15))  # Большая полуось
+    ry = int(params.get('ry', 10))  # Малая полуось
+    return xc, yc, rx, ry
+
+def bresenham_circle_points(params):
+    return circle_points(*circle_args(params))
+
+def bresenham_ellipse_points(params):
+    return ellipse_points(*ellipse_args(params))
+
+def polygon_outline_points(params):
+    return polygon_points(polygon_vertices(params))
+
+
+# Алгоритм -> (функция точек, цвет по умолчанию)
+PRIMITIVES = {
+    'step_by_step': (step_by_step_points, 'black'),
+    'dda': (dda_line_points, 'red'),
+    'bresenham_line': (bresenham_points, 'purple'),
+    'bresenham_circle': (bresenham_circle_points, 'blue'),
+    'bresenham_ellipse': (bresenham_ellipse_points, 'green'),
+    'polygon': (polygon_outline_points, 'orange'),
+}
+
+# Алгоритм -> функция строковых отрезков заливки (строки, начала, концы)
+FILLS = {
+    'bresenham_circle': lambda params: circle_spans(*circle_args(params)),
+    'bresenham_ellipse': lambda params: ellipse_spans(*ellipse_args(params)),
+    'polygon': lambda params: polygon_spans(polygon_vertices(params)),
+}
+
+
+def is_true(value):
+    return value is True or str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+def draw_primitive(canvas, primitive):
+    """
+    Rasterize one primitive onto the canvas.
+    Circles, ellipses and polygons with a true 'fill' are filled row span by row span.
+    :param primitive: Dict with 'algorithm', optional 'parameters', 'color' and 'fill'
+    :raises ValueError: For an unknown algorithm, bad parameters or an unknown color
+    """
+    algorithm = primitive.get('algorithm')
+    if algorithm not in PRIMITIVES:
+        raise ValueError(f"Неизвестный алгоритм: {algorithm}")
+    points, default_color = PRIMITIVES[algorithm]
+    params = primitive.get('parameters') or {}
+    if not isinstance(params, dict):
+        raise ValueError("Параметры примитива должны быть объектом")
+    color = primitive.get('color') or default_color
+    if algorithm in FILLS and is_true(primitive.get('fill', params.get('fill'))):
+        canvas.fill_spans(*FILLS[algorithm](params), color)
+    else:
+        canvas.plot(*points(params), color)
+
+
+# Объём кэша готовых результатов, одинаковые запросы не рисуются и не кодируются заново
+RENDER_CACHE_BYTES = 64 * 1024 * 1024
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+_render_cache_stats = {'hits': 0, 'misses': 0, 'bytes': 0}
+
+
+def render_primitives(primitives, **options):
+    """
+    Rasterize a list of primitives onto one canvas and encode it once.
+    Later primitives are drawn over earlier ones. Results are kept in an LRU
+    cache keyed by the primitives and options, so repeated requests skip both steps.
+    :param primitives: List of dicts accepted by draw_primitive
+    :param options: Canvas and output options accepted by check_options
+    :return: Base64 PNG string, or PNG or RGBA bytes for the 'png' and 'rgba' outputs
+    """
+    options = check_options(**options)
+    key = json.dumps([primitives, options], sort_keys=True)
+    with _render_cache_lock:
+        result = _render_cache.get(key)
+        if result is not None:
+            _render_cache.move_to_end(key)
+            _render_cache_stats['hits'] += 1
+            return result
+        _render_cache_stats['misses'] += 1
+
+    canvas = create_image(options['width'], options['height'])
+    for primitive in primitives:
+        draw_primitive(canvas, primitive)
+    pixels = scale_image(canvas, options['scale_factor'], options['grid'])
+    if options['output'] == 'rgba':
+        result = encode_rgba(pixels)
+    elif options['output'] == 'png':
+        result = encode_png(pixels)
+    else:
+        result = base64.b64encode(encode_png(pixels)).decode()
 
-    steps = max(abs(dx), abs(dy))
+    _remember(key, result)
+    return result
 
-    if steps == 0:
-        draw.point((x1, y1), fill='red')
-    else:
-        x_inc = dx / steps
-        y_inc = dy / steps
 
-        x = x1
-        y = y1
+def _remember(key, result):
+    size = len(result) + len(key)
+    # Большие изображения не кэшируются, иначе одно вытеснит все остальные
+    if size > RENDER_CACHE_BYTES // 8:
+        return
+    with _render_cache_lock:
+        if key in _render_cache:
+            return
+        _render_cache[key] = result
+        _render_cache_stats['bytes'] += size
+        while _render_cache_stats['bytes'] > RENDER_CACHE_BYTES:
+            old_key, old_result = _render_cache.popitem(last=False)
+            _render_cache_stats['bytes'] -= len(old_result) + len(old_key)
 
-        for _ in range(steps + 1):
-            draw.point((round(x), round(y)), fill='red')
-            x += x_inc
-            y += y_inc
 
-    img_str = get_image_data(img)
-    return img_str
+def render_cache_info():
+    with _render_cache_lock:
+        return dict(_render_cache_stats, items=len(_render_cache))
 
-def bresenham_line_algorithm(params):
-    x1 = int(params.get('x1', 5))
-    y1 = int(params.get('y1', 5))
-    x2 = int(params.get('x2', 45))
-    y2 = int(params.get('y2', 45))
-
-    img = create_image()
-    draw = ImageDraw.Draw(img)
-
-    dx = abs(x2 - x1)
-    dy = abs(y2 - y1)
-    x, y = x1, y1
-
-    sx = -1 if x1 > x2 else 1
-    sy = -1 if y1 > y2 else 1
-
-    if dy <= dx:
-        err = dx / 2.0
-        while x != x2:
-            draw.point((x, y), fill='purple')
-            err -= dy
-            if err < 0:
-                y += sy
-                err += dx
-            x += sx
-    else:
-        err = dy / 2.0
-        while y != y2:
-            draw.point((x, y), fill='purple')
-            err -= dx
-            if err < 0:
-                x += sx
-                err += dy
-            y += sy
-    draw.point((x, y), fill='purple')
-
-    img_str = get_image_data(img)
-    return img_str
 
-def bresenham_circle_algorithm(params):
-    xc = int(params.get('xc', 25))
-    yc = int(params.get('yc', 25))
-    r = int(params.get('radius', 20))
-    
-    img = create_image()
-    draw = ImageDraw.Draw(img)
-    
-    x = 0
-    y = r
-    d = 3 - 2 * r
-
-    def draw_circle(xc, yc, x, y):
-        points = [
-            (xc + x, yc + y),
-            (xc - x, yc + y),
-            (xc + x, yc - y),
-            (xc - x, yc - y),
-            (xc + y, yc + x),
-            (xc - y, yc + x),
-            (xc + y, yc - x),
-            (xc - y, yc - x),
-        ]
-        for point in points:
-            if 0 <= point[0] < 50 and 0 <= point[1] < 50:
-                draw.point(point, fill='blue')
-    
-    while y >= x:
-        draw_circle(xc, yc, x, y)
-        x += 1
-        if d > 0:
-            y -= 1
-            d = d + 4 * (x - y) + 10
-        else:
-            d = d + 4 * x + 6
-
-    img_str = get_image_data(img)
-    return img_str
+def step_by_step_algorithm(params, **options):
+    return render_primitives([{'algorithm': 'step_by_step', 'parameters': params}], **options)
 
-def bresenham_ellipse_algorithm(params):
-    xc = int(params.get('xc', 25))
-    yc = int(params.get('yc', 25))
-    rx = int(params.get('rx', 15))  # Большая полуось
-    ry = int(params.get('ry', 10))  # Малая полуось
+def dda_algorithm(params, **options):
+    return render_primitives([{'algorithm': 'dda', 'parameters': params}], **options)
 
-    img = create_image()
-    draw = ImageDraw.Draw(img)
-
-    x = 0
-    y = ry
-    rx2 = rx * rx
-    ry2 = ry * ry
-    two_rx2 = 2 * rx2
-    two_ry2 = 2 * ry2
-    px = 0
-    py = two_rx2 * y
-
-    def draw_ellipse(xc, yc, x, y):
-        points = [
-            (xc + x, yc + y),
-            (xc - x, yc + y),
-            (xc + x, yc - y),
-            (xc - x, yc - y)
-        ]
-        for point in points:
-            if 0 <= point[0] < 50 and 0 <= point[1] < 50:
-                draw.point(point, fill='green')
-
-    # Первая часть
-    p = round(ry2 - (rx2 * ry) + (0.25 * rx2))
-    while px < py:
-        draw_ellipse(xc, yc, x, y)
-        x += 1
-        px += two_ry2
-        if p < 0:
-            p += ry2 + px
-        else:
-            y -= 1
-            py -= two_rx2
-            p += ry2 + px - py
-
-    # Вторая часть
-    p = round(ry2 * (x + 0.5) * (x + 0.5) + rx2 * (y - 1) * (y - 1) - rx2 * ry2)
-    while y >= 0:
-        draw_ellipse(xc, yc, x, y)
-        y -= 1
-        py -= two_rx2
-        if p > 0:
-            p += rx2 - py
-        else:
-            x += 1
-            px += two_ry2
-            p += rx2 - py + px
-
-    img_str = get_image_data(img)
-    return img_str
+def bresenham_line_algorithm(params, **options):
+    return render_primitives([{'algorithm': 'bresenham_line', 'parameters': params}], **options)
+
+def bresenham_circle_algorithm(params, **options):
+    return render_primitives([{'algorithm': 'bresenham_circle', 'parameters': params}], **options)
+
+def bresenham_ellipse_algorithm(params, **options):
+    return render_primitives([{'algorithm': 'bresenham_ellipse', 'parameters': params}], **options)
 
+def polygon_algorithm(params, **options):
+    return render_primitives([{'algorithm': 'polygon', 'parameters': params}], **options)
@@ -1,12 +1,34 @@
-from flask import Flask, request, jsonify, render_template
-from algorithms import execute_algorithm
+from flask import Flask, Response, request, jsonify, render_template
+from algorithms import check_options, execute_algorithm, render_primitives
+from steps import algorithm_steps, stream_events
 
 app = Flask(__name__)
+# Максимальное число примитивов в одном запросе /run_batch
+app.config['MAX_PRIMITIVES'] = 10000
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def render_options(data):
+    # Необязательные поля запроса: размер холста, масштаб, сетка и формат ответа
+    fields = {'width': 'width', 'height': 'height', 'scale': 'scale_factor', 'grid': 'grid', 'format': 'output'}
+    options = {name: data[field] for field, name in fields.items() if data.get(field) is not None}
+    return check_options(**options)
+
+def render_response(result, options):
+    # png и rgba отдаются как есть, без base64 и JSON
+    if options['output'] == 'png':
+        return Response(result, mimetype='image/png')
+    if options['output'] == 'rgba':
+        headers = {
+            'X-Image-Width': str(options['width'] * options['scale_factor']),
+            'X-Image-Height': str(options['height'] * options['scale_factor']),
+            'X-Pixel-Format': 'RGBA',
+        }
+        return Response(result, mimetype='application/octet-stream', headers=headers)
+    return jsonify({'result': result})
+
 @app.route('/run_algorithm', methods=['POST'])
 def run_algorithm():
     data = request.json
@@ -14,9 +36,47 @@ def run_algorithm():
     params = data.get('parameters')
 
     # Выполнение выбранного алгоритма
-    result = execute_algorithm(algorithm, params)
+    try:
+        options = render_options(data)
+        result = execute_algorithm(algorithm, params, **options)
+    except (ValueError, TypeError) as error:
+        return jsonify({'error': str(error)}), 400
 
-    return jsonify({'result': result})
+    return render_response(result, options)
+
+@app.route('/run_batch', methods=['POST'])
+def run_batch():
+    # Вся сцена рисуется на одном холсте и кодируется один раз
+    data = request.json or {}
+    primitives = data.get('primitives')
+    if not isinstance(primitives, list) or not all(isinstance(p, dict) for p in primitives):
+        return jsonify({'error': 'Ожидается список примитивов в поле primitives'}), 400
+    if len(primitives) > app.config['MAX_PRIMITIVES']:
+        return jsonify({'error': f"Не больше {app.config['MAX_PRIMITIVES']} примитивов за запрос"}), 400
+
+    try:
+        options = render_options(data)
+        result = render_primitives(primitives, **options)
+    except (ValueError, TypeError) as error:
+        return jsonify({'error': str(error)}), 400
+
+    return render_response(result, options)
+
+@app.route('/stream_algorithm')
+def stream_algorithm():
+    # Пошаговый поток решений алгоритма в виде Server-Sent Events.
+    # Клиент отменяет поток, закрывая EventSource; после события done его нужно закрыть самому
+    params = request.args.to_dict()
+    algorithm = params.pop('algorithm', None)
+    try:
+        batch = min(max(int(params.pop('batch', 64)), 1), 4096)
+        start = int(request.headers.get('Last-Event-ID', params.pop('start', 0)))
+        steps = algorithm_steps(algorithm, params)
+    except (ValueError, TypeError) as error:
+        return jsonify({'error': str(error)}), 400
+
+    return Response(stream_events(steps, batch, start), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,294 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from decimal import Decimal, getcontext
+from fractions import Fraction
+
+import numpy as np
+
+from algorithms import (bresenham_circle_algorithm, bresenham_ellipse_algorithm, bresenham_line_algorithm,
+                        dda_algorithm, step_by_step_algorithm, PRIMITIVES)
+from raster import polygon_spans
+from steps import algorithm_steps
+
+
+ALGORITHMS = {
+    'step_by_step': step_by_step_algorithm,
+    'dda': dda_algorithm,
+    'bresenham_line': bresenham_line_algorithm,
+    'bresenham_circle': bresenham_circle_algorithm,
+    'bresenham_ellipse': bresenham_ellipse_algorithm,
+}
+LINES = ('step_by_step', 'dda', 'bresenham_line')
+# Signs of dx and dy and whether x is the major axis, one entry per octant
+OCTANTS = [(1, 1, True), (1, 1, False), (-1, 1, False), (-1, 1, True),
+           (-1, -1, True), (-1, -1, False), (1, -1, False), (1, -1, True)]
+getcontext().prec = 50
+
+
+def line_cases(rng, count, size):
+    center = size // 2
+    cases = [
+        {'x1': center, 'y1': center, 'x2': center, 'y2': center},
+        {'x1': 0, 'y1': center, 'x2': size - 1, 'y2': center},
+        {'x1': center, 'y1': 0, 'x2': center, 'y2': size - 1},
+        {'x1': 0, 'y1': 0, 'x2': size - 1, 'y2': size - 1},
+        {'x1': size - 1, 'y1': 0, 'x2': 0, 'y2': size - 1},
+        {'x1': center, 'y1': center, 'x2': center + 1, 'y2': center + 1},
+        {'x1': center, 'y1': center, 'x2': center + 2, 'y2': center + 1},
+    ]
+    for index in range(count):
+        sx, sy, x_major = OCTANTS[index % len(OCTANTS)]
+        major = rng.randint(1, center - 1)
+        minor = rng.randint(0, major)
+        dx, dy = (major, minor) if x_major else (minor, major)
+        x1, y1 = rng.randint(0, size - 1), rng.randint(0, size - 1)
+        cases.append({'x1': x1, 'y1': y1, 'x2': x1 + sx * dx, 'y2': y1 + sy * dy})
+    return cases
+
+
+def circle_cases(rng, count, size):
+    center = size // 2
+    cases = [{'xc': center, 'yc': center, 'radius': r} for r in (-1, 0, 1, 2, 3)]
+    cases += [{'xc': center, 'yc': center, 'radius': rng.randint(4, center - 1)} for _ in range(count)]
+    return cases
+
+
+def ellipse_cases(rng, count, size):
+    center = size // 2
+    cases = [{'xc': center, 'yc': center, 'rx': rx, 'ry': ry}
+             for rx, ry in ((0, 0), (0, 5), (5, 0), (1, 1), (1, 20), (20, 1), (10, 10))]
+    cases += [{'xc': center, 'yc': center, 'rx': rng.randint(2, center - 1), 'ry': rng.randint(2, center - 1)}
+              for _ in range(count)]
+    return cases
+
+
+def make_cases(algorithm, rng, count, size):
+    if algorithm in LINES:
+        return line_cases(rng, count, size)
+    if algorithm == 'bresenham_circle':
+        return circle_cases(rng, count, size)
+    return ellipse_cases(rng, count, size)
+
+
+def raster_points(algorithm, params):
+    xs, ys = PRIMITIVES[algorithm][0](params)
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+def loop_points(algorithm, params):
+    # Point sets of the scalar loops, the same decisions as the original per-pixel code
+    points = []
+    for step in algorithm_steps(algorithm, params):
+        points.extend(tuple(point) for point in step.get('points', [[step['x'], step['y']]]))
+    return points
+
+
+def line_report(algorithm, params, points):
+    x1, y1, x2, y2 = params['x1'], params['y1'], params['x2'], params['y2']
+    dx, dy = x2 - x1, y2 - y1
+    report = {'gaps': 0, 'duplicates': len(points) - len(set(points)), 'deviation': 0.0, 'asymmetric': False}
+    if dx == 0 and dy == 0:
+        return report
+
+    # Exact reference: the minor coordinate of the true line at every major coordinate
+    x_major = abs(dx) >= abs(dy)
+    by_major = {}
+    for x, y in set(points):
+        major, minor = (x, y) if x_major else (y, x)
+        by_major.setdefault(major, []).append(minor)
+        if x_major:
+            exact = y1 + Fraction(dy, dx) * (x - x1)
+        else:
+            exact = x1 + Fraction(dx, dy) * (y - y1)
+        report['deviation'] = max(report['deviation'], float(abs(minor - exact)))
+    start, end = sorted((x1, x2) if x_major else (y1, y2))
+    report['gaps'] = sum(1 for major in range(start, end + 1) if major not in by_major)
+    report['duplicates'] += sum(len(minors) - 1 for minors in by_major.values())
+
+    reverse = raster_points(algorithm, {'x1': x2, 'y1': y2, 'x2': x1, 'y2': y1})
+    report['asymmetric'] = set(reverse) != set(points)
+    return report
+
+
+def curve_report(points, center, axes, symmetries):
+    xc, yc = center
+    rx, ry = axes
+    unique = set(points)
+    report = {'gaps': 0, 'duplicates': len(points) - len(unique), 'deviation': 0.0, 'asymmetric': False}
+    if not unique or min(rx, ry) < 2:
+        return report
+
+    # First-order distance of every pixel to the exact curve x^2 ry^2 + y^2 rx^2 = rx^2 ry^2
+    for x, y in unique:
+        u, v = x - xc, y - yc
+        value = u * u * ry * ry + v * v * rx * rx - rx * rx * ry * ry
+        gradient = (Decimal(2 * u * ry * ry) ** 2 + Decimal(2 * v * rx * rx) ** 2).sqrt()
+        if gradient:
+            report['deviation'] = max(report['deviation'], float(abs(Decimal(value)) / gradient))
+
+    # A closed 8-connected curve gives every pixel at least two neighbours
+    for x, y in unique:
+        neighbours = sum((x + i, y + j) in unique for i in (-1, 0, 1) for j in (-1, 0, 1) if i or j)
+        if neighbours < 2:
+            report['gaps'] += 1
+
+    for mirror in symmetries:
+        if {(xc + a, yc + b) for a, b in (mirror(x - xc, y - yc) for x, y in unique)} != unique:
+            report['asymmetric'] = True
+    return report
+
+
+def validate(algorithm, params):
+    """
+    Check the pixels of one primitive.
+    :return: Dict with 'mismatch' (vectorized pixels differ from the scalar loop),
+             'gaps', 'duplicates', 'deviation' from the exact curve in pixels and 'asymmetric'
+    """
+    points = raster_points(algorithm, params)
+    mismatch = points != loop_points(algorithm, params) if algorithm in LINES \
+        else sorted(points) != sorted(loop_points(algorithm, params))
+
+    if algorithm in LINES:
+        report = line_report(algorithm, params, points)
+    elif algorithm == 'bresenham_circle':
+        r = params['radius']
+        report = curve_report(points, (params['xc'], params['yc']), (r, r),
+                              [lambda u, v: (-u, v), lambda u, v: (u, -v), lambda u, v: (v, u)])
+    else:
+        report = curve_report(points, (params['xc'], params['yc']), (params['rx'], params['ry']),
+                              [lambda u, v: (-u, v), lambda u, v: (u, -v)])
+    report['mismatch'] = mismatch
+    return report
+
+
+def point_in_polygon(x, y, vertices):
+    # Closed even-odd rule in exact integers: points on an edge are inside
+    crossings = 0
+    for (x1, y1), (x2, y2) in zip(vertices, vertices[1:] + vertices[:1]):
+        cross = (x2 - x1) * (y - y1) - (y2 - y1) * (x - x1)
+        if cross == 0 and min(x1, x2) <= x <= max(x1, x2) and min(y1, y2) <= y <= max(y1, y2):
+            return True
+        if (y1 > y) != (y2 > y) and (cross > 0) == (y2 > y1):
+            crossings += 1
+    return crossings % 2 == 1
+
+
+def polygon_fill_mismatches(rng, count, size):
+    """
+    Compare polygon_spans with a brute-force point-in-polygon test on random polygons,
+    degenerate, self-intersecting and axis-aligned ones included.
+    :return: List of the vertex lists whose filled pixels differ
+    """
+    cases = [[(0, 0), (10, 0), (10, 10), (0, 10)], [(0, 0), (10, 0), (5, 0)], [(3, 3), (3, 3), (3, 3)],
+             [(0, 0), (4, 4), (0, 8), (8, 8), (4, 4), (8, 0)]]
+    side = min(size, 64)
+    for _ in range(count):
+        cases.append([(rng.randint(0, side), rng.randint(0, side)) for _ in range(rng.randint(3, 8))])
+    mismatches = []
+    for vertices in cases:
+        rows, starts, ends = polygon_spans(vertices)
+        filled = {(x, y) for y, start, end in zip(rows.tolist(), starts.tolist(), ends.tolist())
+                  for x in range(start, end + 1)}
+        xs, ys = [x for x, _ in vertices], [y for _, y in vertices]
+        expected = {(x, y) for y in range(min(ys) - 1, max(ys) + 2) for x in range(min(xs) - 1, max(xs) + 2)
+                    if point_in_polygon(x, y, vertices)}
+        if filled != expected:
+            mismatches.append(vertices)
+    return mismatches
+
+
+def benchmark(algorithm, cases, repeat, size):
+    """
+    Time the vectorized rasterization and the whole algorithm function.
+    :return: Tuple (rasterized pixels per second, rendered primitives per second)
+    """
+    points = PRIMITIVES[algorithm][0]
+    pixels = sum(len(points(params)[0]) for params in cases)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for params in cases:
+            points(params)
+    raster_seconds = time.perf_counter() - started
+
+    render = ALGORITHMS[algorithm]
+    started = time.perf_counter()
+    for index in range(repeat):
+        for params in cases:
+            # A different canvas size per round keeps the render cache from answering
+            render(params, width=size + index, height=size, scale_factor=1, grid=False, output='rgba')
+    render_seconds = time.perf_counter() - started
+    return pixels * repeat / raster_seconds, len(cases) * repeat / render_seconds
+
+
+def run(algorithms, count, size, repeat, seed):
+    results = []
+    for algorithm in algorithms:
+        cases = make_cases(algorithm, random.Random(seed), count, size)
+        reports = [validate(algorithm, params) for params in cases]
+        pixels_per_second, renders_per_second = benchmark(algorithm, cases, repeat, size)
+        result = {
+            'algorithm': algorithm,
+            'cases': len(cases),
+            'pixels_per_second': pixels_per_second,
+            'renders_per_second': renders_per_second,
+            'mismatches': [params for params, report in zip(cases, reports) if report['mismatch']],
+            'gap_cases': sum(1 for report in reports if report['gaps']),
+            'duplicate_pixels': sum(report['duplicates'] for report in reports),
+            'asymmetric_cases': sum(1 for report in reports if report['asymmetric']),
+            'max_deviation': max(report['deviation'] for report in reports),
+        }
+        results.append(result)
+        print_result(result)
+
+    mismatches = polygon_fill_mismatches(random.Random(seed), count, size)
+    results.append({'algorithm': 'polygon_fill', 'cases': count + 4, 'mismatches': mismatches})
+    print(f"{'polygon_fill':<18} {count + 4:>5} cases  mismatches {len(mismatches):>3}", flush=True)
+    return results
+
+
+def print_result(result):
+    print(f"{result['algorithm']:<18} {result['cases']:>5} cases  "
+          f"{result['pixels_per_second'] / 1e6:>8.2f} Mpx/s  {result['renders_per_second']:>8.1f} renders/s  "
+          f"mismatches {len(result['mismatches']):>3}  gaps {result['gap_cases']:>3}  "
+          f"duplicates {result['duplicate_pixels']:>6}  asymmetric {result['asymmetric_cases']:>3}  "
+          f"max deviation {result['max_deviation']:.3f}", flush=True)
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments for the benchmark.
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Benchmark and validate the lab3 rasterization algorithms.")
+    parser.add_argument('-algorithms', nargs='+', default=list(ALGORITHMS), choices=list(ALGORITHMS),
+                        help='Algorithms to run')
+    parser.add_argument('-count', type=int, default=200, help='Random primitives per algorithm')
+    parser.add_argument('-size', type=int, default=1024, help='Canvas side the primitives are placed on')
+    parser.add_argument('-repeat', type=int, default=3, help='Timed rounds over all primitives')
+    parser.add_argument('-seed', type=int, default=0, help='Random seed')
+    parser.add_argument('-save', help='Write the results as JSON to this path')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    results = run(args.algorithms, args.count, args.size, args.repeat, args.seed)
+
+    if args.save:
+        environment = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine()}
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment, 'results': results}, f, indent=2)
+
+    # Gaps, duplicates and asymmetry are properties of the algorithms, only a mismatch with the loops
+    # or with the brute-force polygon fill fails
+    if any(result['mismatches'] for result in results):
+        sys.exit(1)
+
+#python3 benchmark.py -count 500 -size 2048 -save lab3.json
+
+if __name__ == '__main__':
+    main()
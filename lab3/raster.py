@@ -0,0 +1,325 @@
+import numpy as np
+from PIL import Image, ImageColor
+
+from steps import bresenham_circle_steps, bresenham_ellipse_steps
+
+
+class Canvas:
+    """
+    RGB raster backed by a NumPy buffer. Primitives are plotted as whole
+    coordinate arrays, points outside the canvas are skipped like draw.point does.
+    :param width: Canvas width in pixels
+    :param height: Canvas height in pixels
+    :param background: Background color name or RGB tuple
+    """
+
+    def __init__(self, width=50, height=50, background='white'):
+        self.width = width
+        self.height = height
+        self.pixels = np.empty((height, width, 3), np.uint8)
+        self.pixels[:] = rgb(background)
+
+    def plot(self, xs, ys, color):
+        """
+        Set every pixel (xs[i], ys[i]) to color in one scatter.
+        :param xs: Integer array of x coordinates
+        :param ys: Integer array of y coordinates
+        :param color: Color name or RGB tuple
+        """
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        self.pixels[ys[inside], xs[inside]] = rgb(color)
+
+    def fill_spans(self, ys, starts, ends, color):
+        """
+        Fill the horizontal spans [starts[i], ends[i]] of rows ys[i], one row slice per span.
+        :param ys: Integer array of rows
+        :param starts: Integer array of first columns
+        :param ends: Integer array of last columns, inclusive
+        :param color: Color name or RGB tuple
+        """
+        starts = np.maximum(starts, 0)
+        ends = np.minimum(ends, self.width - 1)
+        inside = (ys >= 0) & (ys < self.height) & (starts <= ends)
+        value = rgb(color)
+        for y, start, end in zip(ys[inside].tolist(), starts[inside].tolist(), ends[inside].tolist()):
+            self.pixels[y, start:end + 1] = value
+
+    def image(self):
+        return Image.fromarray(self.pixels, 'RGB')
+
+
+def rgb(color):
+    return ImageColor.getrgb(color) if isinstance(color, str) else tuple(color)
+
+
+def dda_points(x1, y1, x2, y2):
+    """
+    Pixels of the step-by-step and DDA line algorithms.
+    The coordinates are accumulated one increment at a time, as the loop does,
+    so the rounding of every point is the same.
+    :return: Tuple (xs, ys) of int64 arrays
+    """
+    dx = x2 - x1
+    dy = y2 - y1
+    steps = max(abs(dx), abs(dy))
+    if steps == 0:
+        return np.array([x1]), np.array([y1])
+
+    xs = np.full(steps + 1, dx / steps)
+    ys = np.full(steps + 1, dy / steps)
+    xs[0] = x1
+    ys[0] = y1
+    # add.accumulate sums sequentially, unlike np.sum
+    np.add.accumulate(xs, out=xs)
+    np.add.accumulate(ys, out=ys)
+    return np.round(xs).astype(np.int64), np.round(ys).astype(np.int64)
+
+
+def bresenham_line_points(x1, y1, x2, y2):
+    """
+    Pixels of the Bresenham line algorithm.
+    The error term stays in [0, major) after every step, so the number of
+    minor-axis steps after k major-axis steps is ceil((2k * minor - major) / (2 * major)).
+    :return: Tuple (xs, ys) of int64 arrays
+    """
+    dx = abs(x2 - x1)
+    dy = abs(y2 - y1)
+    sx = -1 if x1 > x2 else 1
+    sy = -1 if y1 > y2 else 1
+    major, minor = (dx, dy) if dy <= dx else (dy, dx)
+    if major == 0:
+        return np.array([x1]), np.array([y1])
+
+    k = np.arange(major + 1, dtype=np.int64)
+    minor_steps = np.maximum(0, -((major - 2 * k * minor) // (2 * major)))
+    if dy <= dx:
+        return x1 + sx * k, y1 + sy * minor_steps
+    return x1 + sx * minor_steps, y1 + sy * k
+
+
+def _circle_octant(r):
+    # Decision variable of bresenham_circle_algorithm as a function of the point:
+    # d(x, y) = 2x^2 + 8x + 2y^2 - 6y + 3 + 4r - 2r^2, y steps down while d > 0
+    c = 3 + 4 * r - 2 * r * r
+    if r < 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+
+    x = np.arange(r + 2, dtype=np.int64)
+    with np.errstate(invalid='ignore'):
+        # Largest y that keeps d(x, y) <= 0, then y only ever moves down
+        limit = np.floor((6 + np.sqrt(36 - 8.0 * (2 * x * x + 8 * x + c))) / 4)
+    y = np.empty_like(x)
+    y[0] = r
+    y[1:] = np.minimum(r, np.minimum.accumulate(np.nan_to_num(limit[:-1], nan=-1))).astype(np.int64)
+
+    count = int(np.argmax(y < x))
+    d = 2 * x * x + 8 * x + 2 * y * y - 6 * y + c
+    if not (y[1:count + 1] == y[:count] - (d[:count] > 0)).all():
+        return _circle_octant_loop(r)
+    return x[:count], y[:count]
+
+
+def _circle_octant_loop(r):
+    # The reference loop is the step generator of the streaming endpoint, centred at 0
+    return _step_coordinates(bresenham_circle_steps(0, 0, r))
+
+
+def _step_coordinates(steps):
+    xs, ys = [], []
+    for step in steps:
+        xs.append(step['x'])
+        ys.append(step['y'])
+    return np.array(xs, np.int64), np.array(ys, np.int64)
+
+
+def circle_points(xc, yc, r):
+    """
+    Pixels of the Bresenham circle algorithm.
+    The octant is computed in closed form and checked against the decision
+    variable of the loop; the loop itself only runs when the check fails.
+    :return: Tuple (xs, ys) of int64 arrays, the eight symmetric copies of the octant
+    """
+    x, y = _circle_octant(r)
+    xs = np.concatenate([xc + x, xc - x, xc + x, xc - x, xc + y, xc - y, xc + y, xc - y])
+    ys = np.concatenate([yc + y, yc + y, yc - y, yc - y, yc + x, yc + x, yc - x, yc - x])
+    return xs, ys
+
+
+def _ellipse_quadrant(rx, ry):
+    rx2 = rx * rx
+    ry2 = ry * ry
+    if rx2 == 0 or ry2 == 0 or ry < 0:
+        return _ellipse_quadrant_loop(rx, ry)
+
+    # First part: p(x, y) = ry2 x^2 + 2 ry2 x + rx2 y^2 - rx2 y + c1, y steps down while p >= 0
+    p = round(ry2 - (rx2 * ry) + (0.25 * rx2))
+    c1 = p - rx2 * ry * ry + rx2 * ry
+    x = np.arange(abs(rx) + 2, dtype=np.int64)
+    rest = -(ry2 * x * x + 2 * ry2 * x + c1)
+    with np.errstate(invalid='ignore'):
+        # Largest y that keeps p(x, y) < 0
+        limit = np.ceil((1 + np.sqrt(1 + 4.0 * rest / rx2)) / 2) - 1
+    y = np.empty_like(x)
+    y[0] = ry
+    y[1:] = np.minimum(ry, np.minimum.accumulate(np.nan_to_num(limit[:-1], nan=-1))).astype(np.int64)
+
+    outside = ry2 * x >= rx2 * y
+    if not outside.any():
+        return _ellipse_quadrant_loop(rx, ry)
+    count = int(np.argmax(outside))
+    decision = ry2 * x * x + 2 * ry2 * x + rx2 * y * y - rx2 * y + c1
+    if not (y[1:count + 1] == y[:count] - (decision[:count] >= 0)).all():
+        return _ellipse_quadrant_loop(rx, ry)
+    x1, y1 = x[:count], y[:count]
+
+    # Second part: p(x, y) = rx2 y^2 - 2 rx2 y + ry2 x^2 + ry2 x + c2, x steps right while p <= 0
+    x0, y0 = count, int(y[count])
+    if y0 < 0:
+        return x1, y1
+    p = round(ry2 * (x0 + 0.5) * (x0 + 0.5) + rx2 * (y0 - 1) * (y0 - 1) - rx2 * ry2)
+    c2 = p - (rx2 * y0 * y0 - 2 * rx2 * y0 + ry2 * x0 * x0 + ry2 * x0)
+    y = np.arange(y0, -1, -1, dtype=np.int64)
+    rest = -(rx2 * y * y - 2 * rx2 * y + c2)
+    with np.errstate(invalid='ignore'):
+        # Largest x that keeps p(x, y) <= 0
+        limit = np.floor((-1 + np.sqrt(1 + 4.0 * rest / ry2)) / 2)
+    x = np.empty_like(y)
+    x[0] = x0
+    x[1:] = np.maximum(x0, np.maximum.accumulate(np.nan_to_num(limit[:-1], nan=-1)) + 1).astype(np.int64)
+    decision = rx2 * y * y - 2 * rx2 * y + ry2 * x * x + ry2 * x + c2
+    if not (x[1:] == x[:-1] + (decision[:-1] <= 0)).all():
+        return _ellipse_quadrant_loop(rx, ry)
+    return np.concatenate([x1, x]), np.concatenate([y1, y])
+
+
+def _ellipse_quadrant_loop(rx, ry):
+    return _step_coordinates(bresenham_ellipse_steps(0, 0, rx, ry))
+
+
+def ellipse_points(xc, yc, rx, ry):
+    """
+    Pixels of the midpoint ellipse algorithm.
+    Both parts are computed in closed form and checked against the decision
+    variable of the loop; the loop itself only runs when the check fails.
+    :return: Tuple (xs, ys) of int64 arrays, the four symmetric copies of the quadrant
+    """
+    x, y = _ellipse_quadrant(rx, ry)
+    xs = np.concatenate([xc + x, xc - x, xc + x, xc - x])
+    ys = np.concatenate([yc + y, yc + y, yc - y, yc - y])
+    return xs, ys
+
+
+def _symmetric_spans(xc, yc, offsets, half_widths):
+    # Rows yc + offsets get spans xc - half .. xc + half, the widest one wins per row
+    if len(offsets) == 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+    low = int(offsets.min())
+    widest = np.full(int(offsets.max()) - low + 1, -1, np.int64)
+    np.maximum.at(widest, offsets - low, half_widths)
+    rows = np.flatnonzero(widest >= 0)
+    half = widest[rows]
+    return yc + low + rows, xc - half, xc + half
+
+
+def circle_spans(xc, yc, r):
+    """
+    Row spans of the disc bounded by the Bresenham circle, outline included.
+    Built from the integer octant of the circle, one span per row.
+    :return: Tuple (rows, first columns, last columns) of int64 arrays
+    """
+    x, y = _circle_octant(r)
+    offsets = np.concatenate([y, -y, x, -x])
+    half_widths = np.concatenate([x, x, y, y])
+    return _symmetric_spans(xc, yc, offsets, half_widths)
+
+
+def ellipse_spans(xc, yc, rx, ry):
+    """
+    Row spans of the area bounded by the midpoint ellipse, outline included.
+    Built from the integer quadrant of the ellipse, one span per row.
+    :return: Tuple (rows, first columns, last columns) of int64 arrays
+    """
+    x, y = _ellipse_quadrant(rx, ry)
+    return _symmetric_spans(xc, yc, np.concatenate([y, -y]), np.concatenate([x, x]))
+
+
+def polygon_points(vertices):
+    """
+    Pixels of a closed polygon outline, every edge drawn with the Bresenham line algorithm.
+    :param vertices: Sequence of (x, y) integer pairs
+    :return: Tuple (xs, ys) of int64 arrays
+    """
+    if len(vertices) == 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    edges = [bresenham_line_points(*vertices[i], *vertices[(i + 1) % len(vertices)]) for i in range(len(vertices))]
+    return np.concatenate([xs for xs, _ in edges]), np.concatenate([ys for _, ys in edges])
+
+
+def polygon_spans(vertices):
+    """
+    Row spans of a closed polygon by the even-odd rule, with an edge table.
+    Every non-horizontal edge crosses the rows [y_low, y_high), its crossings are
+    kept as exact fractions (numerator, dy) and rounded inwards with integer
+    division. The integer points lying exactly on an edge, horizontal edges and
+    the top row included, are added as spans of their own, so pixel centres on
+    or inside the boundary are filled.
+    :param vertices: Sequence of (x, y) integer pairs
+    :return: Tuple (rows, first columns, last columns) of int64 arrays, one span per row run
+    """
+    empty = np.empty(0, np.int64)
+    if len(vertices) < 3:
+        return empty, empty, empty
+
+    points = np.asarray(vertices, np.int64)
+    start = points
+    end = np.roll(points, -1, axis=0)
+    # Edges point upwards, horizontal edges never cross a row
+    flip = start[:, 1] > end[:, 1]
+    low = np.where(flip[:, None], end, start)
+    high = np.where(flip[:, None], start, end)
+
+    # Edge table: one crossing per edge and row of [y_low, y_high], the top row only bounds the edge
+    counts = high[:, 1] - low[:, 1] + 1
+    edge = np.repeat(np.arange(len(low)), counts)
+    rows = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + low[edge, 1]
+    dy = (high[:, 1] - low[:, 1])[edge]
+    sloped = dy > 0
+    numerator = low[edge, 0] * dy + (rows - low[edge, 1]) * (high[:, 0] - low[:, 0])[edge]
+    crossing = sloped & (rows < high[edge, 1])
+
+    # Boundary: horizontal edges whole, other edges where they pass through an integer point
+    flat = ~sloped
+    on_edge = sloped & (numerator % np.where(sloped, dy, 1) == 0)
+    boundary_rows = np.concatenate([rows[flat], rows[on_edge]])
+    boundary_starts = np.concatenate([np.minimum(low[edge, 0], high[edge, 0])[flat],
+                                      numerator[on_edge] // dy[on_edge]])
+    boundary_ends = np.concatenate([np.maximum(low[edge, 0], high[edge, 0])[flat],
+                                    numerator[on_edge] // dy[on_edge]])
+
+    rows, numerator, dy = rows[crossing], numerator[crossing], dy[crossing]
+    order = np.lexsort((numerator / dy, rows))
+    rows, numerator, dy = rows[order], numerator[order], dy[order]
+    # Every row has an even number of crossings, pairs of them bound the interior spans
+    left = -(-numerator[0::2] // dy[0::2])
+    right = numerator[1::2] // dy[1::2]
+    return _merge_spans(np.concatenate([rows[0::2], boundary_rows]),
+                        np.concatenate([left, boundary_starts]),
+                        np.concatenate([right, boundary_ends]))
+
+
+def _merge_spans(rows, starts, ends):
+    # Overlapping and touching spans of a row become one, empty spans are dropped
+    keep = starts <= ends
+    rows, starts, ends = rows[keep], starts[keep], ends[keep]
+    if len(rows) == 0:
+        return rows, starts, ends
+    order = np.lexsort((starts, rows))
+    rows, starts, ends = rows[order], starts[order], ends[order]
+    # Running maximum of the ends within a row: rows are ranked and shifted apart
+    rank = np.cumsum(np.diff(rows, prepend=rows[0]) != 0)
+    spread = int(ends.max() - starts.min()) + 2
+    reach = np.maximum.accumulate(rank * spread + (ends - starts.min())) - rank * spread + starts.min()
+    first = np.ones(len(rows), bool)
+    first[1:] = (rows[1:] != rows[:-1]) | (starts[1:] > reach[:-1] + 1)
+    last = np.append(np.flatnonzero(first)[1:], len(rows)) - 1
+    return rows[first], starts[first], reach[last]
@@ -0,0 +1,203 @@
+import json
+
+
+def dda_steps(x1, y1, x2, y2):
+    """
+    Decisions of the step-by-step and DDA line algorithms, one per plotted pixel.
+    :return: Generator of dicts with the pixel, the rounding error of the exact
+             point and the increment to the next point
+    """
+    dx = x2 - x1
+    dy = y2 - y1
+    steps = max(abs(dx), abs(dy))
+    if steps == 0:
+        yield {'x': x1, 'y': y1, 'error': [0.0, 0.0], 'step': [0, 0]}
+        return
+
+    x_inc = dx / steps
+    y_inc = dy / steps
+    x = x1
+    y = y1
+    for _ in range(steps + 1):
+        yield {'x': round(x), 'y': round(y), 'error': [x - round(x), y - round(y)], 'step': [x_inc, y_inc]}
+        x += x_inc
+        y += y_inc
+
+
+def bresenham_line_steps(x1, y1, x2, y2):
+    """
+    Decisions of the Bresenham line algorithm.
+    :return: Generator of dicts with the pixel, the error term after the step
+             and the step to the next pixel
+    """
+    dx = abs(x2 - x1)
+    dy = abs(y2 - y1)
+    x, y = x1, y1
+    sx = -1 if x1 > x2 else 1
+    sy = -1 if y1 > y2 else 1
+
+    if dy <= dx:
+        err = dx / 2.0
+        while x != x2:
+            err -= dy
+            step_y = 0
+            if err < 0:
+                step_y = sy
+                err += dx
+            yield {'x': x, 'y': y, 'error': err, 'step': [sx, step_y]}
+            y += step_y
+            x += sx
+    else:
+        err = dy / 2.0
+        while y != y2:
+            err -= dx
+            step_x = 0
+            if err < 0:
+                step_x = sx
+                err += dy
+            yield {'x': x, 'y': y, 'error': err, 'step': [step_x, sy]}
+            x += step_x
+            y += sy
+    yield {'x': x, 'y': y, 'error': 0.0, 'step': [0, 0]}
+
+
+def bresenham_circle_steps(xc, yc, r):
+    """
+    Decisions of the Bresenham circle algorithm over one octant.
+    :return: Generator of dicts with the octant pixel, its eight symmetric
+             pixels, the decision variable and the step to the next pixel
+    """
+    x = 0
+    y = r
+    d = 3 - 2 * r
+    while y >= x:
+        points = [
+            [xc + x, yc + y], [xc - x, yc + y], [xc + x, yc - y], [xc - x, yc - y],
+            [xc + y, yc + x], [xc - y, yc + x], [xc + y, yc - x], [xc - y, yc - x],
+        ]
+        step_y = -1 if d > 0 else 0
+        yield {'x': xc + x, 'y': yc + y, 'points': points, 'error': d, 'step': [1, step_y]}
+        x += 1
+        if d > 0:
+            y -= 1
+            d = d + 4 * (x - y) + 10
+        else:
+            d = d + 4 * x + 6
+
+
+def bresenham_ellipse_steps(xc, yc, rx, ry):
+    """
+    Decisions of the midpoint ellipse algorithm over one quadrant, in its two parts.
+    :return: Generator of dicts with the quadrant pixel, its four symmetric
+             pixels, the part, the decision variable and the step to the next pixel
+    """
+    x = 0
+    y = ry
+    rx2 = rx * rx
+    ry2 = ry * ry
+    two_rx2 = 2 * rx2
+    two_ry2 = 2 * ry2
+    px = 0
+    py = two_rx2 * y
+
+    def event(part, p, step):
+        points = [[xc + x, yc + y], [xc - x, yc + y], [xc + x, yc - y], [xc - x, yc - y]]
+        return {'x': xc + x, 'y': yc + y, 'points': points, 'part': part, 'error': p, 'step': step}
+
+    # Первая часть
+    p = round(ry2 - (rx2 * ry) + (0.25 * rx2))
+    while px < py:
+        yield event(1, p, [1, 0] if p < 0 else [1, -1])
+        x += 1
+        px += two_ry2
+        if p < 0:
+            p += ry2 + px
+        else:
+            y -= 1
+            py -= two_rx2
+            p += ry2 + px - py
+
+    # Вторая часть
+    p = round(ry2 * (x + 0.5) * (x + 0.5) + rx2 * (y - 1) * (y - 1) - rx2 * ry2)
+    while y >= 0:
+        yield event(2, p, [0, -1] if p > 0 else [1, -1])
+        y -= 1
+        py -= two_rx2
+        if p > 0:
+            p += rx2 - py
+        else:
+            x += 1
+            px += two_ry2
+            p += rx2 - py + px
+
+
+def polygon_steps(vertices):
+    """
+    Decisions of the polygon outline, every edge drawn with the Bresenham line algorithm.
+    :param vertices: Sequence of (x, y) integer pairs, the last edge closes the outline
+    :return: Generator of the bresenham_line_steps dicts, each with the index of its edge
+    """
+    for i in range(len(vertices)):
+        for step in bresenham_line_steps(*vertices[i], *vertices[(i + 1) % len(vertices)]):
+            step['edge'] = i
+            yield step
+
+
+def polygon_vertices(params):
+    # Вершины многоугольника: список пар [x, y]
+    vertices = params.get('points') or []
+    if isinstance(vertices, str):
+        vertices = json.loads(vertices)
+    return [(int(x), int(y)) for x, y in vertices]
+
+
+def algorithm_steps(algorithm, params):
+    """
+    Start the decision generator of an algorithm, with the parameter defaults of algorithms.py.
+    :raises ValueError: For an unknown algorithm or bad parameters
+    """
+    if algorithm in ('step_by_step', 'dda', 'bresenham_line'):
+        default_start, default_end = (0, 0) if algorithm == 'step_by_step' else (5, 45)
+        x1 = int(params.get('x1', default_start))
+        y1 = int(params.get('y1', default_start))
+        x2 = int(params.get('x2', default_end))
+        y2 = int(params.get('y2', default_end))
+        if algorithm == 'bresenham_line':
+            return bresenham_line_steps(x1, y1, x2, y2)
+        return dda_steps(x1, y1, x2, y2)
+    if algorithm == 'bresenham_circle':
+        return bresenham_circle_steps(int(params.get('xc', 25)), int(params.get('yc', 25)),
+                                      int(params.get('radius', 20)))
+    if algorithm == 'bresenham_ellipse':
+        return bresenham_ellipse_steps(int(params.get('xc', 25)), int(params.get('yc', 25)),
+                                       int(params.get('rx', 15)), int(params.get('ry', 10)))
+    if algorithm == 'polygon':
+        return polygon_steps(polygon_vertices(params))
+    raise ValueError(f"Неизвестный алгоритм: {algorithm}")
+
+
+def stream_events(steps, batch=64, start=0):
+    """
+    Format decisions as Server-Sent Events, batch decisions per 'steps' event.
+    Only the generator state is kept, so a stream holds O(1) memory whatever the primitive size.
+    The id of every event is the number of decisions sent so far, a reconnecting
+    client passes it back as start and the skipped decisions are recomputed, not stored.
+    :param steps: Generator from algorithm_steps
+    :param batch: Decisions per event
+    :param start: Number of decisions to skip
+    :return: Generator of SSE text chunks, ending with a 'done' event
+    """
+    sent = 0
+    pending = []
+    for step in steps:
+        sent += 1
+        if sent <= start:
+            continue
+        step['i'] = sent - 1
+        pending.append(step)
+        if len(pending) >= batch:
+            yield f'id: {sent}\nevent: steps\ndata: {json.dumps(pending)}\n\n'
+            pending = []
+    if pending:
+        yield f'id: {sent}\nevent: steps\ndata: {json.dumps(pending)}\n\n'
+    yield f'id: {sent}\nevent: done\ndata: {json.dumps({"steps": sent})}\n\n'
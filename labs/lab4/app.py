@@ -1,7 +1,9 @@
-import matplotlib.pyplot as plt
 import numpy as np
 from scipy.interpolate import CubicSpline
 
+from editable import EditableSpline
+from sampling import adaptive_samples, decimate
+
 # Исходные точки графика
 graphic_points = [
     {"x": 0, "y": 200},
@@ -22,46 +24,164 @@ graphic_points = [
     {"x": 750, "y": 200}
 ]
 
+# Больше вертикальных линий узлов не рисуется, они слились бы в сплошной фон
+MAX_KNOT_LINES = 200
+
+# Точки как массивы x и y: список словарей {"x", "y"} или пара массивов (x, y)
+def point_arrays(points):
+    if isinstance(points, tuple):
+        return np.asarray(points[0], dtype=float), np.asarray(points[1], dtype=float)
+    x_points = np.array([point["x"] for point in points], dtype=float)
+    y_points = np.array([point["y"] for point in points], dtype=float)
+    return x_points, y_points
+
+# Ширина и высота одного пикселя осей в единицах данных, и ширина осей в пикселях
+def pixel_size(ax):
+    x_min, x_max = ax.get_xlim()
+    y_min, y_max = ax.get_ylim()
+    box = ax.get_window_extent()
+    columns = max(int(box.width), 1)
+    return (x_max - x_min) / columns, (y_max - y_min) / max(box.height, 1), columns
+
 # Функция для построения осей
-def draw_axis(ax):
+def draw_axis(ax, points=graphic_points):
     ax.axhline(200, color='black', linewidth=2, label='Ось X')  # Главная горизонтальная ось
     ax.axvline(0, color='black', linewidth=2)                  # Вертикальная ось
-    for point in graphic_points:
-        ax.axvline(point['x'], color='gray', linewidth=0.5, linestyle='--')  # Вертикальные линии
+    x_points, _ = point_arrays(points)
+    if len(x_points) <= MAX_KNOT_LINES:
+        for x in x_points:
+            ax.axvline(x, color='gray', linewidth=0.5, linestyle='--')  # Вертикальные линии
 
-# Функция отрисовки прямой линии
-def draw_init_chart(ax):
-    x_points = [point["x"] for point in graphic_points]
-    y_points = [point["y"] for point in graphic_points]
+# Функция отрисовки прямой линии, прореженной до пикселей осей
+def draw_init_chart(ax, points=graphic_points):
+    x_points, y_points = point_arrays(points)
+    x_min, x_max = ax.get_xlim()
+    _, _, columns = pixel_size(ax)
+    x_points, y_points = decimate(x_points, y_points, x_min, x_max, columns)
     ax.plot(x_points, y_points, color='blue', label='Исходная линия')
 
 # Функция отрисовки аппроксимации с помощью Кубического Сплайна
-def draw_approximation(ax):
-    x_points = [point["x"] for point in graphic_points]
-    y_points = [point["y"] for point in graphic_points]
+def draw_approximation(ax, points=graphic_points):
+    x_points, y_points = point_arrays(points)
 
     # Создаем интерполяцию CubicSpline
     spline = CubicSpline(x_points, y_points)
-    
-    # Создаем новые значения для гладкости кривой
-    x_new = np.linspace(min(x_points), max(x_points), 300)
+
+    # Точек больше там, где кривизна больше: ломаная отходит от сплайна не больше чем на полпикселя
+    pixel_width, pixel_height, columns = pixel_size(ax)
+    x_new = adaptive_samples(spline, pixel_height / 2, pixel_width)
     y_new = spline(x_new)
+    x_min, x_max = ax.get_xlim()
+    x_new, y_new = decimate(x_new, y_new, x_min, x_max, columns)
 
     # Рисуем аппроксимирующую кривую
     ax.plot(x_new, y_new, color='red', linewidth=2, label='Аппроксимация (Spline)')
 
+# Рисование графика на готовых осях, общее для окна и пакетного рендера
+def draw_chart(ax, points=graphic_points, title="График с аппроксимацией кубическим сплайном"):
+    # Лимиты задаются до рисования: по ним считаются размер пикселя и прореживание
+    (x_min, x_max), (y_min, y_max) = chart_limits(points)
+    ax.set_xlim(x_min, x_max)        # Лимиты оси X
+    ax.set_ylim(y_min, y_max)        # Лимиты оси Y
+
+    draw_axis(ax, points)            # Оси
+    draw_init_chart(ax, points)      # Ломаная линия
+    draw_approximation(ax, points)   # Аппроксимирующая кривая
+
+    ax.legend()                      # Легенда
+    ax.set_title(title)
+
+# Лимиты осей по данным, для исходных точек это (-50, 800) и (0, 400)
+def chart_limits(points):
+    x_points, y_points = point_arrays(points)
+    x_pad = (x_points.max() - x_points.min()) / 15 or 1
+    y_pad = (y_points.max() - y_points.min()) * 0.4 or 1
+    return ((x_points.min() - x_pad, x_points.max() + x_pad),
+            (min(0, y_points.min()), y_points.max() + y_pad))
+
+# Замена части прореженной линии между x_low и x_high новыми точками, прореженными по тем же столбцам пикселей
+def splice_line(ax, line, x_new, y_new, x_low, x_high):
+    x_old, y_old = line.get_data()
+    x_old, y_old = np.asarray(x_old, dtype=float), np.asarray(y_old, dtype=float)
+    x_min, x_max = ax.get_xlim()
+    _, _, columns = pixel_size(ax)
+    x_new, y_new = decimate(x_new, y_new, x_min, x_max, columns)
+    left, right = x_old < x_low, x_old > x_high
+    line.set_data(np.concatenate([x_old[left], x_new, x_old[right]]),
+                  np.concatenate([y_old[left], y_new, y_old[right]]))
+
+# Редактирование точек мышью: перетаскивание, двойной щелчок добавляет точку, правый щелчок удаляет.
+# Сплайн пересчитывается только около изменённой точки, и в линиях заменяются только изменённые сегменты
+def connect_editor(fig, ax, points=graphic_points, pick_radius=10):
+    spline = EditableSpline(*point_arrays(points))
+    init_line = next(line for line in ax.lines if line.get_label() == 'Исходная линия')
+    curve = next(line for line in ax.lines if line.get_label() == 'Аппроксимация (Spline)')
+    state = {'index': None, 'background': None}
+    # Линии рисуются поверх сохранённого фона осей (blit), остальная фигура при правке не перерисовывается
+    init_line.set_animated(True)
+    curve.set_animated(True)
+
+    def on_draw(event):
+        state['background'] = fig.canvas.copy_from_bbox(ax.bbox)
+        ax.draw_artist(init_line)
+        ax.draw_artist(curve)
+
+    def redraw(changed):
+        first, stop = changed
+        x_low, x_high = spline.x[first], spline.x[stop]
+        splice_line(ax, init_line, spline.x[first:stop + 1], spline.y[first:stop + 1], x_low, x_high)
+        splice_line(ax, curve, *spline.polyline(first, stop), x_low, x_high)
+        if state['background'] is None:
+            fig.canvas.draw_idle()
+            return
+        fig.canvas.restore_region(state['background'])
+        ax.draw_artist(init_line)
+        ax.draw_artist(curve)
+        fig.canvas.blit(ax.bbox)
+
+    def nearest(event):
+        # Ближайшая точка в пикселях экрана, если она не дальше pick_radius
+        screen = ax.transData.transform(np.column_stack([spline.x, spline.y]))
+        distance = np.hypot(screen[:, 0] - event.x, screen[:, 1] - event.y)
+        index = int(np.argmin(distance))
+        return index if distance[index] <= pick_radius else None
+
+    def on_press(event):
+        if event.inaxes is not ax:
+            return
+        index = nearest(event)
+        if event.dblclick and index is None:
+            _, changed = spline.insert(event.xdata, event.ydata)
+            redraw(changed)
+        elif event.button == 3 and index is not None and len(spline.x) > 2:
+            redraw(spline.delete(index))
+        elif event.button == 1:
+            state['index'] = index
+
+    def on_motion(event):
+        if state['index'] is None or event.inaxes is not ax:
+            return
+        redraw(spline.move(state['index'], y=event.ydata))
+
+    def on_release(event):
+        state['index'] = None
+
+    fig.canvas.mpl_connect('draw_event', on_draw)
+    fig.canvas.mpl_connect('button_press_event', on_press)
+    fig.canvas.mpl_connect('motion_notify_event', on_motion)
+    fig.canvas.mpl_connect('button_release_event', on_release)
+    return spline
+
 # Основная функция визуализации
 def visualize():
-    fig, ax = plt.subplots(figsize=(12, 6))
-    draw_axis(ax)                    # Оси
-    draw_init_chart(ax)              # Ломаная линия
-    draw_approximation(ax)           # Аппроксимирующая кривая
+    # pyplot импортируется здесь, чтобы импорт модуля не выбирал бэкенд и не открывал окон
+    import matplotlib.pyplot as plt
 
-    ax.set_xlim(-50, 800)            # Лимиты оси X
-    ax.set_ylim(0, 400)              # Лимиты оси Y
-    ax.legend()                      # Легенда
-    ax.set_title("График с аппроксимацией кубическим сплайном")
+    fig, ax = plt.subplots(figsize=(12, 6))
+    draw_chart(ax)
+    connect_editor(fig, ax)
     plt.show()
 
 # Запуск программы
-visualize()
+if __name__ == '__main__':
+    visualize()
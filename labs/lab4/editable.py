@@ -0,0 +1,170 @@
+import numpy as np
+from scipy.interpolate import CubicSpline, PPoly
+from scipy.linalg import solve_banded
+
+
+class EditableSpline:
+    """
+    Cubic spline through control points that can be moved, inserted and deleted.
+    The knot slopes solve the same tridiagonal system as CubicSpline with the
+    default not-a-knot ends. The interior rows are diagonally dominant by at least
+    a factor of two, so the effect of an edit on a slope halves with every knot;
+    an edit re-solves only the rows within window knots of it, and only the
+    segments around them are recomputed and resampled.
+    :param x: Strictly increasing knot positions
+    :param y: Knot values
+    :param window: Knots re-solved on each side of an edit, 64 keeps the error below 2^-64 of the change
+    :param samples: Samples per segment of the cached polyline
+    """
+
+    def __init__(self, x, y, window=64, samples=16):
+        self.window = window
+        self.samples = samples
+        self.x = np.array(x, dtype=float)
+        self.y = np.array(y, dtype=float)
+        if len(self.x) < 2:
+            raise ValueError("A spline needs at least two points.")
+        if np.any(np.diff(self.x) <= 0):
+            raise ValueError("x must be strictly increasing.")
+        self.refit()
+
+    def refit(self):
+        """
+        Solve the whole system again, like fitting a new CubicSpline.
+        """
+        spline = CubicSpline(self.x, self.y)
+        self.slopes = spline(self.x, 1)
+        self.c = spline.c.copy()
+        self._points = np.empty((len(self.x) - 1, self.samples))
+        self._values = np.empty((len(self.x) - 1, self.samples))
+        self._sample(0, len(self.x) - 1)
+
+    def __call__(self, x, nu=0):
+        return PPoly(self.c, self.x)(x, nu)
+
+    def move(self, index, y=None, x=None):
+        """
+        Move a control point; its x must stay between its neighbours.
+        :return: Range (first, stop) of segments whose coefficients and samples changed
+        """
+        if x is not None:
+            low = self.x[index - 1] if index > 0 else -np.inf
+            high = self.x[index + 1] if index < len(self.x) - 1 else np.inf
+            if not low < x < high:
+                raise ValueError("x must stay between the neighbouring points.")
+            self.x[index] = x
+        if y is not None:
+            self.y[index] = y
+        return self._update(index)
+
+    def insert(self, x, y):
+        """
+        Insert a control point at its place in x.
+        :return: Tuple (index of the new point, range of changed segments)
+        """
+        index = int(np.searchsorted(self.x, x))
+        if index < len(self.x) and self.x[index] == x:
+            raise ValueError("A point with this x already exists.")
+        self.x = np.insert(self.x, index, x)
+        self.y = np.insert(self.y, index, y)
+        self.slopes = np.insert(self.slopes, index, 0.0)
+        # Сегмент, в который попала точка, делится на два
+        segment = min(max(index - 1, 0), self.c.shape[1] - 1)
+        self.c = np.insert(self.c, segment, 0.0, axis=1)
+        self._points = np.insert(self._points, segment, 0.0, axis=0)
+        self._values = np.insert(self._values, segment, 0.0, axis=0)
+        return index, self._update(index)
+
+    def delete(self, index):
+        """
+        Delete a control point, at least two have to remain.
+        :return: Range of changed segments
+        """
+        if len(self.x) <= 2:
+            raise ValueError("A spline needs at least two points.")
+        self.x = np.delete(self.x, index)
+        self.y = np.delete(self.y, index)
+        self.slopes = np.delete(self.slopes, index)
+        segment = min(index, self.c.shape[1] - 1)
+        self.c = np.delete(self.c, segment, axis=1)
+        self._points = np.delete(self._points, segment, axis=0)
+        self._values = np.delete(self._values, segment, axis=0)
+        return self._update(min(index, len(self.x) - 1))
+
+    def polyline(self, first=0, stop=None):
+        """
+        Cached samples of segments first..stop-1, for plotting.
+        :param first: First segment
+        :param stop: Segment after the last one, all remaining segments by default
+        :return: Tuple (x, y) of arrays, ending at knot stop
+        """
+        stop = len(self.x) - 1 if stop is None else stop
+        return (np.append(self._points[first:stop].ravel(), self.x[stop]),
+                np.append(self._values[first:stop].ravel(), self.y[stop]))
+
+    def _update(self, index):
+        n = len(self.x)
+        if n <= 2 * self.window + 4:
+            # Small splines are refitted as a whole, that is as cheap as a window
+            self.refit()
+            return 0, n - 1
+        first = max(index - self.window, 0)
+        last = min(index + self.window, n - 1)
+        self._solve(first, last)
+        # Segments on both sides of every re-solved slope
+        first_segment = max(first - 1, 0)
+        stop_segment = min(last + 1, n - 1)
+        self._sample(first_segment, stop_segment)
+        return first_segment, stop_segment
+
+    def _solve(self, first, last):
+        # Rows first..last of the system of CubicSpline, slopes outside the window are fixed
+        x, y, n = self.x, self.y, len(self.x)
+        rows = np.arange(first, last + 1)
+        dx = np.diff(x)
+        slope = np.diff(y) / dx
+
+        inner = np.clip(rows, 1, n - 2)
+        lower = dx[inner]
+        diagonal = 2 * (dx[inner - 1] + dx[inner])
+        upper = dx[inner - 1]
+        rhs = 3 * (dx[inner] * slope[inner - 1] + dx[inner - 1] * slope[inner])
+
+        if first == 0:
+            d = x[2] - x[0]
+            diagonal[0] = dx[1]
+            upper[0] = d
+            rhs[0] = ((dx[0] + 2 * d) * dx[1] * slope[0] + dx[0] ** 2 * slope[1]) / d
+        else:
+            rhs[0] -= lower[0] * self.slopes[first - 1]
+        if last == n - 1:
+            d = x[-1] - x[-3]
+            diagonal[-1] = dx[-2]
+            lower[-1] = d
+            rhs[-1] = (dx[-1] ** 2 * slope[-2] + (2 * d + dx[-1]) * dx[-2] * slope[-1]) / d
+        else:
+            rhs[-1] -= upper[-1] * self.slopes[last + 1]
+
+        banded = np.zeros((3, len(rows)))
+        banded[0, 1:] = upper[:-1]
+        banded[1] = diagonal
+        banded[2, :-1] = lower[1:]
+        self.slopes[first:last + 1] = solve_banded((1, 1), banded, rhs, overwrite_ab=True,
+                                                   overwrite_b=True, check_finite=False)
+
+    def _sample(self, first, stop):
+        # Coefficients of segments first..stop-1 in the PPoly form of CubicSpline, then their samples
+        x, y, s = self.x, self.y, self.slopes
+        h = x[first + 1:stop + 1] - x[first:stop]
+        slope = (y[first + 1:stop + 1] - y[first:stop]) / h
+        t = (s[first:stop] + s[first + 1:stop + 1] - 2 * slope) / h
+        self.c[0, first:stop] = t / h
+        self.c[1, first:stop] = (slope - s[first:stop]) / h - t
+        self.c[2, first:stop] = s[first:stop]
+        self.c[3, first:stop] = y[first:stop]
+
+        offsets = np.arange(self.samples) / self.samples
+        local = h[:, None] * offsets
+        c = self.c[:, first:stop, None]
+        self._points[first:stop] = x[first:stop, None] + local
+        self._values[first:stop] = ((c[0] * local + c[1]) * local + c[2]) * local + c[3]
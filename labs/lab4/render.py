@@ -0,0 +1,151 @@
+import argparse
+import csv
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app import draw_chart, point_arrays
+
+
+# Фигура и оси процесса-исполнителя, создаются один раз и переиспользуются для всех рядов
+_figure = None
+_axes = None
+
+
+def load_series(path):
+    """
+    Read the point series of a file.
+    A CSV file has x and y columns and holds one series. A JSON file holds a list
+    of {"x", "y"} points like graphic_points, {"x": [...], "y": [...]}, or an
+    object mapping series names to either form.
+    :param path: Path to a .csv or .json file
+    :return: List of (name, (x, y)) pairs of float arrays sorted by x
+    :raises ValueError: For an unsupported file type, a CSV without x and y columns or too few points
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    if path.lower().endswith('.csv'):
+        with open(path, newline='') as f:
+            header = next(csv.reader(f), None)
+            if header is None or 'x' not in header or 'y' not in header:
+                raise ValueError(f"{path} needs a header with x and y columns.")
+            columns = [header.index('x'), header.index('y')]
+            data = np.loadtxt(f, delimiter=',', usecols=columns, ndmin=2)
+        series = [(name, (data[:, 0], data[:, 1]))]
+    elif path.lower().endswith('.json'):
+        with open(path) as f:
+            data = json.load(f)
+        if isinstance(data, dict) and not ('x' in data and 'y' in data):
+            series = [(f'{name}_{key}', _json_points(value)) for key, value in data.items()]
+        else:
+            series = [(name, _json_points(data))]
+    else:
+        raise ValueError(f"Unsupported file type: {path}")
+
+    for index, (series_name, (x, y)) in enumerate(series):
+        if len(x) < 2:
+            raise ValueError(f"Series {series_name} needs at least two points.")
+        order = np.argsort(x, kind='stable')
+        series[index] = (series_name, (x[order], y[order]))
+    return series
+
+
+def _json_points(data):
+    if isinstance(data, dict):
+        return np.asarray(data['x'], dtype=float), np.asarray(data['y'], dtype=float)
+    return point_arrays(data)
+
+
+def _init_worker(width, height, dpi):
+    # Agg выбирается до первого импорта pyplot-зависимых модулей, окон не будет
+    global _figure, _axes
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+
+    _figure = Figure(figsize=(width, height), dpi=dpi)
+    _axes = _figure.add_subplot()
+
+
+def render_file(path, output_dir, image_format='png'):
+    """
+    Render every series of a file into output_dir, reusing the worker's figure.
+    :return: List of written chart paths
+    """
+    if _figure is None:
+        _init_worker(12, 6, 100)
+    written = []
+    for name, points in load_series(path):
+        _axes.clear()
+        draw_chart(_axes, points, title=name)
+        out_path = os.path.join(output_dir, f'{name}.{image_format}')
+        _figure.savefig(out_path, format=image_format)
+        written.append(out_path)
+    return written
+
+
+def expand_inputs(patterns):
+    # Каталоги раскрываются в их .csv и .json файлы, шаблоны — через glob
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths += sorted(glob.glob(os.path.join(pattern, '*.csv')) + glob.glob(os.path.join(pattern, '*.json')))
+        else:
+            paths += sorted(glob.glob(pattern)) or [pattern]
+    return paths
+
+
+def render_all(paths, output_dir, workers=None, image_format='png', width=12, height=6, dpi=100):
+    """
+    Render the charts of many files on a process pool.
+    :param paths: Input .csv and .json files
+    :param workers: Number of worker processes, all cores by default
+    :return: Dict path -> list of written charts, or the error message for that file
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(width, height, dpi)) as executor:
+        futures = {path: executor.submit(render_file, path, output_dir, image_format) for path in paths}
+        for path, future in futures.items():
+            # Any error of one file, a malformed one included, is reported for it without stopping the batch
+            try:
+                results[path] = future.result()
+            except Exception as error:
+                results[path] = f'{type(error).__name__}: {error}'
+    return results
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments for the batch renderer.
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Render cubic spline charts of point series without a display.")
+    parser.add_argument('-input', nargs='+', required=True, help='CSV or JSON files, directories or glob patterns')
+    parser.add_argument('-output', default='charts', help='Directory for the rendered charts')
+    parser.add_argument('-workers', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('-format', default='png', help='Image format, e.g. png, svg or pdf')
+    parser.add_argument('-dpi', type=int, default=100, help='Resolution of raster formats')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    results = render_all(expand_inputs(args.input), args.output, args.workers, args.format, dpi=args.dpi)
+    failed = 0
+    for path, result in results.items():
+        if isinstance(result, str):
+            failed += 1
+            print(f"{path}: {result}")
+        else:
+            print(f"{path}: {len(result)} chart(s)")
+    if failed:
+        raise SystemExit(1)
+
+#python3 render.py -input data/*.csv series.json -output charts -workers 4
+
+if __name__ == '__main__':
+    main()
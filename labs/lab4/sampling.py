@@ -0,0 +1,55 @@
+import numpy as np
+
+
+def adaptive_samples(spline, tolerance, pixel_width, max_per_segment=64):
+    """
+    Choose x values at which the polyline through the spline stays within tolerance of it.
+    On a cubic segment of width h the chord error is at most h^2 * max|y''| / 8 and y''
+    is linear, so it peaks at a knot; each segment gets just enough samples for that bound.
+    Segments are never split finer than half a pixel column.
+    :param spline: Fitted CubicSpline
+    :param tolerance: Allowed vertical error in data units, about half a pixel
+    :param pixel_width: Width of one pixel column in data units
+    :param max_per_segment: Upper bound of samples per segment
+    :return: Sorted array of x values, including every knot
+    """
+    knots = spline.x
+    widths = np.diff(knots)
+    curvature = np.abs(spline(knots, 2))
+    peak = np.maximum(curvature[:-1], curvature[1:])
+
+    counts = np.ceil(widths * np.sqrt(peak / (8 * tolerance)))
+    counts = np.minimum(counts, np.ceil(2 * widths / pixel_width))
+    counts = np.clip(counts, 1, max_per_segment).astype(np.int64)
+
+    # Sample j of segment i lies at knots[i] + widths[i] * j / counts[i]
+    segment = np.repeat(np.arange(len(widths)), counts)
+    step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    samples = knots[segment] + widths[segment] * step / counts[segment]
+    return np.append(samples, knots[-1])
+
+
+def decimate(x, y, x_min, x_max, columns):
+    """
+    Reduce a polyline to the first, last, lowest and highest point of every pixel column.
+    The drawn line covers the same pixels, so the cost of plotting depends on the
+    width of the axes and not on the number of points.
+    :param x: Sorted x values
+    :param y: y values
+    :param x_min: Left limit of the axes
+    :param x_max: Right limit of the axes
+    :param columns: Width of the axes in pixels
+    :return: Tuple (x, y) of the kept points in their original order
+    """
+    if len(x) <= 4 * columns:
+        return x, y
+
+    column = np.floor((x - x_min) * (columns / (x_max - x_min))).astype(np.int64)
+    starts = np.flatnonzero(np.diff(column, prepend=column[0] - 1))
+    ends = np.append(starts[1:], len(x)) - 1
+
+    # Sorting by column and then y puts the lowest point first and the highest last in every column
+    order = np.lexsort((y, column))
+    keep = np.concatenate([starts, ends, order[starts], order[ends]])
+    keep = np.unique(keep)
+    return x[keep], y[keep]
@@ -1,8 +1,74 @@
 import argparse
-import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.figure import Figure
 from PIL import Image
 
 
+# Pixels per luminosity strip, the strip buffers take a few megabytes for any image size
+STRIP_PIXELS = 1 << 18
+CHANNELS = ['Red', 'Green', 'Blue', 'Luminosity', 'RGB Average']
+FILE_NAMES = ["red", "green", "blue", "luminosity", "rgb"]
+
+# Chart figures reused between calls, keyed by whether they hold all five histograms
+_figures = {}
+
+
+def channel_counts(image, strip_pixels=STRIP_PIXELS):
+    """
+    Count the R, G, B and luminosity values of an image in one pass.
+    The channel counts come from PIL's histogram; luminosity is computed over row strips
+    as round(0.2126 * r + 0.7152 * g + 0.0722 * b) with the same float64 operations
+    in the same order, and np.rint rounds halves to even like round.
+    :param image: PIL.Image.Image object, modes other than RGB and RGBA are converted to RGB
+    :param strip_pixels: Approximate number of pixels converted to an array at once
+    :return: int64 array of shape (4, 256) with the R, G, B and luminosity counts
+    """
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+    counts = np.zeros((4, 256), dtype=np.int64)
+    counts[:3] = np.reshape(image.histogram()[:768], (3, 256))
+
+    width, height = image.size
+    rows = max(min(strip_pixels // max(width, 1), height), 1)
+    # Strip buffers are allocated once and everything is computed in place
+    brightness = np.empty((rows, width))
+    term = np.empty((rows, width))
+    index = np.empty((rows, width), dtype=np.intp)
+    for top in range(0, height, rows):
+        strip = np.asarray(image.crop((0, top, width, min(top + rows, height))))
+        n = len(strip)
+        np.multiply(strip[..., 0], 0.2126, out=brightness[:n])
+        np.multiply(strip[..., 1], 0.7152, out=term[:n])
+        brightness[:n] += term[:n]
+        np.multiply(strip[..., 2], 0.0722, out=term[:n])
+        brightness[:n] += term[:n]
+        np.rint(brightness[:n], out=brightness[:n])
+        np.copyto(index[:n], brightness[:n], casting='unsafe')
+        counts[3] += np.bincount(index[:n].ravel(), minlength=256)
+    return counts
+
+
+def histograms_from_counts(counts):
+    """
+    Turn channel counts into the R, G, B, luminosity and RGB average histograms.
+    :param counts: Array of shape (4, 256) from channel_counts, or a sum of several
+    :return: List of five histograms, each a list of 256 ints
+    """
+    red, green, blue, luminosity = np.asarray(counts, dtype=np.int64)
+    # Integer true division and rounding half to even, like round(sum(...) / 3)
+    rgb_average = np.rint((red + green + blue) / 3).astype(np.int64)
+    return [histogram.tolist() for histogram in (red, green, blue, luminosity, rgb_average)]
+
+
+def calculate_histograms(image):
+    """
+    Calculate the R, G, B, luminosity and RGB average histograms of an image together.
+    :param image: PIL.Image.Image object
+    :return: List of five histograms, each a list of 256 ints
+    """
+    return histograms_from_counts(channel_counts(image))
+
+
 def calculate_histogram(image, channel):
     """
     Calculate histogram data for a specific color channel or luminosity directly from an image object.
@@ -10,17 +76,37 @@ def calculate_histogram(image, channel):
     :param channel: Channel index (0 - Red, 1 - Green, 2 - Blue, 3 - Luminosity)
     :return: Histogram data as a list
     """
-    width, height = image.size
-    pixels = image.getcolors(width * height)  # Get pixel data (count, color tuples)
-
-    histogram = [0] * 256
-    for count, rgb in pixels:
-        if channel == 3:  # Luminosity calculation
-            brightness = round(0.2126 * rgb[0] + 0.7152 * rgb[1] + 0.0722 * rgb[2])
-            histogram[brightness] += count
+    return channel_counts(image)[channel].tolist()
+
+
+def _histogram_axes(ax):
+    # One filled step patch instead of 256 bars, value i spans [i - 0.5, i + 0.5] like a bar of width 1
+    bars = ax.stairs(np.zeros(256), np.arange(257) - 0.5, fill=True, color='darkviolet')
+    ax.set_xlabel('Value Range')
+    ax.set_ylabel('Number of Values')
+    ax.set_xlim([0, 255])
+    ax.set_xticks(range(0, 256, 20))
+    return bars
+
+
+def _histogram_figure(combined):
+    # The figures are created once per process, drawing a chart only updates heights, limits and titles
+    if combined not in _figures:
+        if combined:
+            figure = Figure(figsize=(19.2, 9.6), layout='tight')
+            axes = list(figure.subplots(2, 3).flat)
+            axes.pop().set_visible(False)
         else:
-            histogram[rgb[channel]] += count
-    return histogram
+            figure = Figure()
+            axes = [figure.add_subplot()]
+        _figures[combined] = figure, [(ax, _histogram_axes(ax)) for ax in axes]
+    return _figures[combined]
+
+
+def _draw_histogram(ax, bars, data, title):
+    bars.set_data(data)
+    ax.set_title(title)
+    ax.set_ylim([0, max(data) * 1.1 or 1])
 
 
 def save_histogram(data, output_path, title):
@@ -30,40 +116,41 @@ def save_histogram(data, output_path, title):
     :param output_path: Path to save the histogram image
     :param title: Title for the histogram
     """
-    plt.figure()
-    plt.bar(range(256), data, width=1, color='darkviolet')
-    plt.title(title)
-    plt.xlabel('Value Range')
-    plt.ylabel('Number of Values')
-    plt.xlim([0, 255])
-    plt.ylim([0, max(data) * 1.1])
-    plt.xticks(range(0, 256, 20))
-    plt.savefig(output_path)
-    plt.close()
+    figure, [(ax, bars)] = _histogram_figure(combined=False)
+    _draw_histogram(ax, bars, data, title)
+    figure.savefig(output_path)
 
 
-def generate_histograms(image, output_dir):
+def save_histograms(histograms, output_dir, combined=False):
+    """
+    Save the R, G, B, luminosity and RGB average histograms as images.
+    :param histograms: List of five histograms from calculate_histograms
+    :param output_dir: Directory to save histogram images
+    :param combined: Save all five as subplots of one histograms.png instead of five files
+    """
+    titles = [f"{channel} Histogram" for channel in CHANNELS]
+    if combined:
+        figure, axes = _histogram_figure(combined=True)
+        for (ax, bars), hist, title in zip(axes, histograms, titles):
+            _draw_histogram(ax, bars, hist, title)
+        figure.savefig(f"{output_dir}/histograms.png")
+        return
+    for hist, file_name, title in zip(histograms, FILE_NAMES, titles):
+        save_histogram(hist, f"{output_dir}/{file_name}_histogram.png", title)
+
+
+def generate_histograms(image, output_dir, combined=False):
     """
     Generate histograms for R, G, B, luminosity, and RGB average directly from an image object.
     :param image: PIL.Image.Image object
     :param output_dir: Directory to save histogram images
+    :param combined: Save all five charts in one image
     """
-    # Calculate histograms for R, G, B, and Luminosity channels
-    channels = ['Red', 'Green', 'Blue', 'Luminosity']
-    histograms = [calculate_histogram(image, i) for i in range(3)]
-    histograms.append(calculate_histogram(image, channel=3))
-    
-    # Calculate average RGB histogram
-    rgb_average = [
-        round(sum(channel[i] for channel in histograms[:3]) / 3)
-        for i in range(256)
-    ]
-    histograms.append(rgb_average)
+    # R, G, B, luminosity and RGB average in one pass over the pixels
+    histograms = calculate_histograms(image)
 
     # Save histograms to files
-    file_names = ["red", "green", "blue", "luminosity", "rgb"]
-    for hist, file_name, title in zip(histograms, file_names, channels + ['RGB Average']):
-        save_histogram(hist, f"{output_dir}/{file_name}_histogram.png", f"{title} Histogram")
+    save_histograms(histograms, output_dir, combined)
 
 
 def load_image(image_path):
@@ -83,6 +170,7 @@ def parse_arguments():
     parser = argparse.ArgumentParser(description="Generate histograms for an image.")
     parser.add_argument('-name', required=True, help='Path to the image file')
     parser.add_argument('-path', required=True, help='Path to the output directory')
+    parser.add_argument('-combined', action='store_true', help='Save all five histograms in one image')
     return parser.parse_args()
 
 
@@ -93,7 +181,7 @@ def main():
     image = load_image(args.name)
 
     # Generate and save histograms
-    generate_histograms(image, args.path)
+    generate_histograms(image, args.path, args.combined)
 
 #python3 app.py -name "/home/dima/KG/CG/labs/lab5/download (1).jpeg" -path "/home/dima/KG/CG/labs/lab5"
 
@@ -0,0 +1,151 @@
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from PIL import Image
+
+from app import channel_counts, histograms_from_counts, save_histograms
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+
+def image_counts(path, reduce=1):
+    """
+    Count the R, G, B and luminosity values of one image file.
+    With reduce > 1 the image is decoded at 1/reduce of its size: JPEG files through
+    the decoder's draft mode, which skips most of the decoding work, other files by
+    averaging reduce x reduce blocks. The histograms are then approximate.
+    :param path: Path to the image file
+    :param reduce: Integer downscaling factor, 1 for exact histograms
+    :return: int64 array of shape (4, 256) from channel_counts
+    """
+    with Image.open(path) as image:
+        draft = reduce > 1 and image.format == 'JPEG'
+        if draft:
+            width, height = image.size
+            image.draft('RGB', (max(width // reduce, 1), max(height // reduce, 1)))
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+        if reduce > 1 and not draft:
+            image = image.reduce(reduce)
+        return channel_counts(image)
+
+
+def expand_inputs(patterns):
+    # Directories expand to the images they contain, patterns through glob
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths += sorted(os.path.join(pattern, name) for name in os.listdir(pattern)
+                            if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            paths += sorted(glob.glob(pattern)) or [pattern]
+    return paths
+
+
+def iterate_counts(paths, workers=None, reduce=1):
+    """
+    Count the histograms of many images on a process pool.
+    At most a few tasks per worker are in flight, so memory does not grow with the
+    number of images; results come in the order they finish.
+    :param paths: Image files
+    :param workers: Number of worker processes, all cores by default
+    :param reduce: Downscaling factor passed to image_counts
+    :return: Iterator of (index in paths, counts array or the error message)
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for index, path in enumerate(paths):
+            pending[executor.submit(image_counts, path, reduce)] = index
+            if len(pending) >= 4 * workers:
+                yield from _finished(pending)
+        while pending:
+            yield from _finished(pending)
+
+
+def _finished(pending):
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        index = pending.pop(future)
+        # Any error of one image, DecompressionBombError included, is recorded without stopping the run
+        try:
+            yield index, future.result()
+        except Exception as error:
+            yield index, f'{type(error).__name__}: {error}'
+
+
+def aggregate(paths, output_dir, workers=None, reduce=1, combined=False):
+    """
+    Build the combined histograms of a dataset and the histograms of every image.
+    Writes into output_dir:
+    counts.npy - uint32 array of shape (len(paths), 4, 256) with the R, G, B and
+    luminosity counts of each image in the order of paths, zeros for failed images,
+    written through a memory map;
+    summary.json - the paths, errors, dataset totals and their five histograms;
+    the charts of the dataset histograms, as generate_histograms draws them, in one
+    image if combined is set.
+    :return: Dict path -> error message for the images that could not be read
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    counts = np.lib.format.open_memmap(os.path.join(output_dir, 'counts.npy'), mode='w+',
+                                       dtype=np.uint32, shape=(len(paths), 4, 256))
+    total = np.zeros((4, 256), dtype=np.int64)
+    errors = {}
+    for index, result in iterate_counts(paths, workers, reduce):
+        if isinstance(result, str):
+            errors[paths[index]] = result
+        else:
+            counts[index] = result
+            total += result
+    counts.flush()
+    del counts
+
+    histograms = histograms_from_counts(total)
+    summary = {
+        'paths': paths,
+        'errors': errors,
+        'reduce': reduce,
+        'pixels': int(total[0].sum()),
+        'histograms': dict(zip(['red', 'green', 'blue', 'luminosity', 'rgb'], histograms)),
+    }
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f)
+    save_histograms(histograms, output_dir, combined)
+    return errors
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments for dataset histograms.
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Generate combined histograms for many images.")
+    parser.add_argument('-input', nargs='+', required=True, help='Image files, directories or glob patterns')
+    parser.add_argument('-path', required=True, help='Path to the output directory')
+    parser.add_argument('-workers', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('-reduce', type=int, default=1,
+                        help='Decode images at 1/reduce of their size for faster, approximate histograms')
+    parser.add_argument('-combined', action='store_true', help='Save all five dataset histograms in one image')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    paths = expand_inputs(args.input)
+    errors = aggregate(paths, args.path, args.workers, args.reduce, args.combined)
+    print(f"{len(paths) - len(errors)} of {len(paths)} image(s) counted")
+    for path, error in errors.items():
+        print(f"{path}: {error}")
+    if errors:
+        raise SystemExit(1)
+
+#python3 batch.py -input dataset/ "photos/*.jpg" -path /home/dima/KG/CG/labs/lab5/dataset -workers 4
+
+if __name__ == '__main__':
+    main()